@@ -6,75 +6,177 @@ Main body of atmosscibot.
 This bot creates word clouds from scientific articles and posts them to Twitter.
 """
 # Standard library
-from datetime import datetime
+from datetime import datetime, timedelta
 import json
-from glob import glob
 import os
-from random import choice, randint
 import re
-import time
 
 # External packages
 import feedparser as fp
-import numpy as np
-from PIL import Image
 from tinydb import TinyDB, where
-from wordcloud import WordCloud, STOPWORDS
 
 # Local modules
-from font_manager import get_font
+from browser_pool import BrowserPool
+from canonical_url import canonical_key
+from entry_store import open_entry_store
+from extraction_rules import RuleRegistry
+from feed_fetcher import FeedCache, fetch_feeds
+from fetch_router import FetchRouter
+from font_manager import DEFAULT_FONT_PATH, FontIndex, get_font
+from http_client import HttpClient
 from logger import logger
-from parse_article import extract_text
+from page_cache import PageCache
+from pipeline import Pipeline, Stage
+from post_queue import PostQueue
+from parse_article import (
+    FetchError,
+    NotOpenAccessError,
+    UnsupportedContentError,
+    extract_text,
+)
+from rate_limiter import HostRateLimiter
+from render_assets import RENDER_PROFILES
 from settings import Settings
 from shorten_url_api import UrlShortener
 from twitter_api import TwitterApi
+from word_frequencies import WordFrequencies
+from wordcloud_renderer import RenderResult, WordCloudRenderer
 
 
 SUCCESS = 0
 NO_TEXT = 1  # mostly because it's not open access
+SHORT_TEXT = 2
+RENDER_ERROR = 3
+HTTP_4XX = 4
+HTTP_5XX = 5
+FETCH_ERROR = 6
+PAYWALLED = 7
+UNSUPPORTED_CONTENT = 8  # too large or not HTML/XML
+POST_QUEUED = 9  # word cloud is waiting in the post queue
+POST_ERROR = 10
+# Names of failure classes in the [retry] section of settings
+FAILURE_CLASSES = {
+    NO_TEXT: "no_text",
+    SHORT_TEXT: "short_text",
+    RENDER_ERROR: "render_error",
+    HTTP_4XX: "http_4xx",
+    HTTP_5XX: "http_5xx",
+    FETCH_ERROR: "fetch_error",
+    PAYWALLED: "paywalled",
+    UNSUPPORTED_CONTENT: "unsupported_content",
+    POST_ERROR: "post_error",
+}
+
+
+class EntryJob(object):
+    """RSS entry passed between the stages of processing."""
+
+    def __init__(self, journ, entry):
+        self.journ = journ
+        self.entry = entry
+        self.url = entry.link
+        self.j_short_name = journ["short_name"]
+        self.text = None
+        self.image = None  # wordcloud_renderer.RenderResult
+        self.status = None  # None until the entry fails or is posted
 
 
 class AtmosSciBot(object):
     """Main class for running atmosscibot."""
 
-    def __init__(self, curdir, settings, twitter_api, url_shortener):
+    def __init__(self, curdir, settings, twitter_api, url_shortener, http_client):
         self.settings = settings
         self.BOT_NAME = self.settings.get_bot_name()
         self.curdir = curdir
         self.browser_exec_dir = self.settings.get_browser_exec_dir()
+        self.browser_pool = BrowserPool(
+            self.browser_exec_dir,
+            size=self.settings.get_browser_pool_size(),
+            max_pages=self.settings.get_browser_max_pages(),
+            page_load_timeout=self.settings.get_browser_page_load_timeout(),
+        )
         self.j_list_path = os.path.join(self.curdir, self.settings.get_journal_list())
+        self.rules = RuleRegistry(
+            os.path.join(self.curdir, self.settings.get_extraction_rules()), self.j_list_path
+        )
         self.db_file = self.settings.get_db_file()
+        self.feed_cache_file = self.settings.get_feed_cache_file()
+        self.fetch_stats_file = self.settings.get_fetch_stats_file()
+        self.page_cache = PageCache(
+            os.path.join(self.curdir, self.settings.get_page_cache_dir()),
+            max_size=self.settings.get_page_cache_max_size(),
+            max_age=self.settings.get_page_cache_max_age(),
+            offline=self.settings.get_page_cache_offline(),
+        )
+        self.max_page_size = int(self.settings.get_max_page_size() * 1024**2)
+        self.feed_workers = self.settings.get_feed_workers()
+        self.extract_workers = self.settings.get_extract_workers()
+        self.pipeline_queue_size = self.settings.get_pipeline_queue_size()
+        self.feed_timeout = self.settings.get_feed_timeout()
+        self.retry_ttls = self.settings.get_retry_ttls()
+        self.retry_backoff = self.settings.get_retry_backoff()
+        self.retry_max_attempts = self.settings.get_retry_max_attempts()
 
         # Word Cloud settings
         self.minwords = self.settings.get_min_words()
         self.stopwords_dir = self.settings.get_stopwords_dir()
+        self.word_frequencies = WordFrequencies(os.path.join(self.curdir, self.stopwords_dir))
         self.dpi = self.settings.get_dpi()
         self.width = self.settings.get_width()
         self.height = self.settings.get_height()
         self.wordcloud_mask_dir = self.settings.get_wordcloud_mask_dir()
+        self.renderer = WordCloudRenderer(
+            os.path.join(self.curdir, self.wordcloud_mask_dir),
+            self.width,
+            self.height,
+            default_font=os.path.join(self.curdir, DEFAULT_FONT_PATH),
+            workers=self.settings.get_render_workers(),
+            encoding=self.settings.get_image_encoding(),
+        )
         self.allow_font_change = self.settings.get_font_switch()
-        self.font_name = None  # use default font
+        self.render_profile = self.settings.get_render_profile()
+        self.mention_render_profile = self.settings.get_mention_render_profile()
+        self.font_index = FontIndex(
+            os.path.join(self.curdir, self.settings.get_font_index_file()),
+            max_size=self.settings.get_font_cache_max_size(),
+            negative_ttl=self.settings.get_font_negative_ttl(),
+        )
         self.temp_dir = self.settings.get_temp_dir()
         self.temp_file = self.settings.get_temp_file()
+        self.archive_wordclouds = self.settings.get_archive_wordclouds()
         self.mentions_file = self.settings.get_mentions_file()
 
         self.no_magic_word_gif = self.settings.get_no_magic_word_gif()
 
         self.twitter_api = twitter_api
+        self.post_queue = PostQueue(
+            os.path.join(self.curdir, self.settings.get_post_queue_file()),
+            twitter_api,
+            max_attempts=self.settings.get_post_max_attempts(),
+            max_wait=self.settings.get_post_max_wait(),
+        )
         self.url_shortener = url_shortener
-
-    def check_new_entry(self, url):
-        # TODO: check status?
-        query_result = self.DB.search(where("url") == url)
-        new_entry = len(query_result) == 0
-        return new_entry
-
-    def write_entry(self, url, j_short_name, status):
-        tstamp = datetime.utcnow().strftime("%Y%m%d%H%M%S")
-        new_entry = dict(
-            journal_short_name=j_short_name, url=url, status=status, datetime=tstamp
+        self.http_client = http_client
+
+    def get_retry_after(self, status, attempts):
+        """Timestamp after which a failed entry is retried (None = never)."""
+        ttl = self.retry_ttls.get(FAILURE_CLASSES.get(status), 0)
+        if ttl <= 0 or attempts >= self.retry_max_attempts:
+            return None
+        delay = timedelta(hours=ttl * self.retry_backoff ** (attempts - 1))
+        return (datetime.utcnow() + delay).strftime("%Y%m%d%H%M%S")
+
+    def write_entry(self, url, j_short_name, status, title=None):
+        previous = self.DB.get(url)
+        if previous is None or previous["status"] in [SUCCESS, POST_QUEUED]:
+            # Queued posts have not failed yet
+            attempts = 1
+        else:
+            attempts = (previous.get("attempts") or 1) + 1
+        retry_after = self.get_retry_after(status, attempts)
+        self.DB.add(
+            url, j_short_name, status, attempts=attempts, retry_after=retry_after, title=title
         )
-        self.DB.insert(new_entry)
 
     def make_title(self, url, journal, title):
         journal_name = journal
@@ -82,69 +184,76 @@ class AtmosSciBot(object):
             title = re.sub(r"Atmosphere, Vol. [0-9]+, Pages [0-9]+: ", "", title)
         return "#{}: {}".format(journal_name, title)
 
-    def make_img_file(self):
+    def make_img_file(self, extension="png"):
         output_dir = os.path.join(self.curdir, self.temp_dir)
-        if not os.path.isdir(output_dir):
-            os.mkdir(output_dir)
-        tstamp = datetime.utcnow().strftime("%Y%m%d%H%M%S")
-        self.img_file = os.path.join(output_dir, self.temp_file.format(datetime=tstamp))
-
-    def get_exclude_words(self):
-        """list of words to exclude"""
-        exclude_words = list(STOPWORDS)
-        stopword_files = glob(os.path.join(self.curdir, self.stopwords_dir, "*.txt"))
-        for fname in stopword_files:
-            with open(fname, "r") as f:
-                exclude_words += f.read().split("\n")
-        self.exclude_words = set(exclude_words)
-
-    def get_stencil(self):
-        """Randomly select a stencil from the specified directory."""
-        # Other masks can be extracted from
-        # Font-Awesome (http://minimaxir.com/2016/05/wordclouds/)
-        imgdir = os.path.join(self.curdir, self.wordcloud_mask_dir)
-        imgpath = choice(glob(os.path.join(imgdir, "cloud_*.png")))
-        self.stencil = np.array(Image.open(imgpath))
-
-    def generate_wc(self, background_color="#ffffff"):
-        """generate wordcloud and save to file"""
+        os.makedirs(output_dir, exist_ok=True)
+        # Microseconds keep the names unique when clouds are rendered concurrently
+        tstamp = datetime.utcnow().strftime("%Y%m%d%H%M%S%f")
+        fname = self.temp_file.format(datetime=tstamp)
+        return os.path.join(output_dir, f"{os.path.splitext(fname)[0]}.{extension}")
+
+    def generate_wc(
+        self, text, cmap, font_name=None, profile=None, background_color="#ffffff"
+    ):
+        """
+        Generate a word cloud as an encoded image.
+
+        The image is also written to `temp_dir` if `archive_wordclouds` is set.
+
+        Arguments
+        ---------
+        text: str
+            Article text
+        cmap: str
+            Name of a matplotlib colormap
+        font_name: str, optional
+            Name of a Google font; None for the default font
+        profile: str, optional
+            Name of the render profile; `render_profile` from settings by default
+        background_color: str, optional
+            Background color
+
+        Returns
+        -------
+        wordcloud_renderer.RenderResult
+            Image data or the error in word cloud generation
+        """
         # fig_kw = dict(figsize=(self.width/self.dpi, self.height/self.dpi),
         #               dpi=self.dpi)
-        self.get_exclude_words()
         try:
-            self.get_stencil()
+            frequencies = self.word_frequencies.get(text)
+            # Other masks can be extracted from
+            # Font-Awesome (http://minimaxir.com/2016/05/wordclouds/)
+            stencil = self.renderer.random_stencil()
 
             # Download font or use the default one
-            font_path = get_font(self.font_name)
+            font_path = get_font(font_name, index=self.font_index)
             if self.allow_font_change:
                 logger.info(f"Using {font_path} font")
 
-            wc = WordCloud(
-                width=self.width,
-                height=self.height,
-                font_path=font_path,
-                colormap=self.cmap,
-                stopwords=self.exclude_words,
+            result = self.renderer.render(
+                frequencies,
+                cmap,
+                stencil,
+                font_path,
                 background_color=background_color,
-                mode="RGBA",
-                mask=self.stencil,
-            ).generate(self.text)
-
-            self.make_img_file()
-            wc.to_file(self.img_file)
-            self.error_in_wordcloud_gen = None
-
-            self.font_name = None  # reset to default
-
+                profile=profile or self.render_profile,
+            )
+            if result.ok and self.archive_wordclouds:
+                with open(self.make_img_file(result.extension), "wb") as f:
+                    f.write(result.data)
+            return result
         except Exception as e:
-            self.error_in_wordcloud_gen = e
+            return RenderResult(error=e)
 
     def parse_request(self, mention):
         regex_font = r"\[font=\s*([\w\s]*)\]"
+        regex_profile = r"\[profile=\s*(\w*)\s*\]"
         contains_j_name = False
         j_short_name = None
         url = None
         font_name = None
+        profile = self.mention_render_profile
         contains_request = (
             "make" in mention.text.lower()
             and "word" in mention.text.lower()
@@ -155,6 +264,9 @@ class AtmosSciBot(object):
             r = re.search(regex_font, mention.text)
             if r is not None:
                 font_name = r.group(1)
+        r = re.search(regex_profile, mention.text)
+        if r is not None and r.group(1).lower() in RENDER_PROFILES:
+            profile = r.group(1).lower()
         hashtags = [i["text"] for i in mention.entities["hashtags"]]
         if len(hashtags) == 1:
             j_short_name = hashtags[0].upper()
@@ -166,7 +278,7 @@ class AtmosSciBot(object):
         if contains_url:
             url = mention.entities["urls"][0]["expanded_url"]
         is_correct = contains_request and contains_j_name and contains_url
-        return is_correct, contains_magic_word, url, j_short_name, font_name
+        return is_correct, contains_magic_word, url, j_short_name, font_name, profile
 
     def make_reply(self, user_name, url, err_msg=None):
         if err_msg is None:
@@ -221,13 +333,14 @@ class AtmosSciBot(object):
                     logger.info("Skipping this self mention")
                     continue
 
-                kw = dict(imgname=None, in_reply_to_status_id=mention.id_str)
+                kw = dict(imgname=None, in_reply_to_tweet_id=mention.id_str)
                 (
                     is_correct,
                     please,
                     url,
                     j_short_name,
-                    self.font_name,
+                    font_name,
+                    profile,
                 ) = self.parse_request(mention)
                 short_url = None
                 no_error = True
@@ -245,7 +358,7 @@ class AtmosSciBot(object):
                     reply = self.make_reply(user_name, short_url, err_msg)
                     no_error = False
                 if no_error:
-                    self.cmap = [
+                    cmap = [
                         i["cmap"]
                         for i in self.j_list
                         if i["short_name"] == j_short_name
@@ -253,15 +366,26 @@ class AtmosSciBot(object):
                     # URL must be correct and directly lead to
                     # webpage with text to be parsed
                     # (unlike the ones in RSS feeds)
-                    self.text = extract_text(
-                        url, self.browser_exec_dir, j_short_name, url_ready=True
+                    text = extract_text(
+                        url,
+                        self.browser_exec_dir,
+                        j_short_name,
+                        url_ready=True,
+                        client=self.http_client,
+                        browser_pool=self.browser_pool,
+                        cache=self.page_cache,
+                        rules=self.rules,
+                        max_size=self.max_page_size,
                     )
-                    if len(self.text.split(" ")) >= self.minwords:
-                        self.generate_wc()
-                        if self.error_in_wordcloud_gen is None:
+                    if len(text.split(" ")) >= self.minwords:
+                        result = self.generate_wc(
+                            text, cmap, font_name=font_name, profile=profile
+                        )
+                        if result.ok:
                             short_url = self.url_shortener.shorten(url)
                             reply = self.make_reply(user_name, short_url)
-                            kw["imgname"] = self.img_file
+                            kw["imgname"] = result.filename
+                            kw["image"] = result.data
                         else:
                             # TODO: specify the problem
                             err_msg = "Please check your request or the URL"
@@ -269,80 +393,243 @@ class AtmosSciBot(object):
                     else:
                         err_msg = "Something went wrong or there is not enough text (<100 words)"
                         reply = self.make_reply(user_name, short_url, err_msg)
-                self.twitter_api.post_tweet(reply, short_url, **kw)
+                self.post_queue.add(reply, short_url, **kw)
+                self.process_post_queue()
 
-    def run(self):
-        with open(self.j_list_path) as json_file:
-            self.j_list = json.load(json_file)
-
-        # self.handle_mentions()
-
-        self.DB = TinyDB(os.path.join(curdir, self.db_file))
-
-        for journ in self.j_list:
-            f = fp.parse(journ["rss"])
+    def select_new_entries(self, feeds):
+        """
+        Select entries that have to be processed from all feeds in one pass.
+
+        Drops entries that are already in the database (using the set of
+        canonical keys loaded once), EGU preprints and "Issue information".
+        Failed entries that are due for a retry are taken from the database,
+        so they are retried even if their feed has not changed.
+
+        Returns
+        -------
+        new_entries: list
+            List of (journal, entry) tuples
+        updated_feeds: list
+            List of (journal, feed) tuples with the feeds that have changed
+        """
+        processed_keys = self.DB.keys()
+        new_entries = []
+        updated_feeds = []
+        for journ, f in feeds:
             j_short_name = journ["short_name"]
-            self.cmap = journ["cmap"]
+            if f is None:
+                logger.warning(f"({j_short_name}) Failed to fetch RSS of {journ['name']}")
+                continue
+            if f.status == 304:
+                logger.info(f"({j_short_name}) RSS of {journ['name']} is not modified")
+                continue
+            if self.feed_cache.is_unchanged(journ["rss"], f):
+                logger.info(f"({j_short_name}) RSS of {journ['name']} is unchanged")
+                # No new entries, but keep the new ETag/Last-Modified for the next request
+                self.feed_cache.update(journ["rss"], f)
+                continue
             logger.info(f"({j_short_name}) Parsed RSS of {journ['name']}")
+            updated_feeds.append((journ, f))
 
-            for i, entry in enumerate(f.entries):
-                # Sleep for a few seconds to avoid too many requests errors
-                time.sleep(randint(1, 11))
+            for entry in f.entries:
                 try:
                     url = entry.link
                 except AttributeError:
                     logger.error(f"No `link` attribute in entry={entry}")
                     continue
-                if (j_short_name == "ASL") and ("author" in entry):
+                key = canonical_key(url)
+                if key in processed_keys:
+                    continue
+                if (j_short_name == "ASL") and (entry.get("author", None) == ""):
                     # Skip "Issue information"
                     # TODO: needs improvement...
-                    if entry.author == "":
-                        new_entry = False
-                new_entry = self.check_new_entry(url)
-
-                # if j_short_name in ['ACP', 'AMT', 'GMD']:
+                    continue
                 # Check if the article is in the preprint stage
                 try:
                     ispp = "Preprint under review" in entry.summary_detail.value
                 except AttributeError:
                     ispp = False
-
                 if ispp:
                     # Do not process preprints in EGU journals
-                    new_entry = False
+                    continue
+                # The same article can appear in several feeds
+                processed_keys.add(key)
+                new_entries.append((journ, entry))
+
+        journals = {journ["short_name"]: journ for journ in self.j_list}
+        for record in self.DB.due():
+            if record["key"] in processed_keys:
+                continue
+            journ = journals.get(record["journal_short_name"])
+            if journ is None or record.get("title") is None:
+                # Stored before titles were kept; retried when it is in the feed again
+                continue
+            logger.info(f"({journ['short_name']}) Retrying {record['url']}")
+            processed_keys.add(record["key"])
+            entry = fp.FeedParserDict(link=record["url"], title=record["title"])
+            new_entries.append((journ, entry))
+        return new_entries, updated_feeds
+
+    def extract_entry(self, job):
+        """Pipeline stage: extract text of the article."""
+        logger.info(f"({job.j_short_name}) New entry in: {job.url}")
+        try:
+            job.text = extract_text(
+                job.url,
+                self.browser_exec_dir,
+                job.j_short_name,
+                url_ready=False,
+                client=self.http_client,
+                browser_pool=self.browser_pool,
+                router=self.fetch_router,
+                cache=self.page_cache,
+                rules=self.rules,
+                max_size=self.max_page_size,
+                raise_errors=True,
+            )
+        except UnsupportedContentError:
+            job.status = UNSUPPORTED_CONTENT
+            return job
+        except FetchError as e:
+            if e.status_code is not None and 400 <= e.status_code < 500:
+                job.status = HTTP_4XX
+            elif e.status_code is not None and e.status_code >= 500:
+                job.status = HTTP_5XX
+            else:
+                job.status = FETCH_ERROR
+            return job
+        except NotOpenAccessError:
+            job.status = PAYWALLED
+            return job
+
+        if len(job.text) <= self.minwords:
+            logger.warning(
+                f"({job.j_short_name}) Text length {len(job.text)}"
+                f" is less than {self.minwords}"
+            )
+            job.status = NO_TEXT if len(job.text) == 0 else SHORT_TEXT
+        return job
+
+    def render_entry(self, job):
+        """Pipeline stage: make a word cloud."""
+        if job.status is not None:
+            return job
+        result = self.generate_wc(
+            job.text, job.journ["cmap"], profile=job.journ.get("render_profile")
+        )
+        # The text is not needed anymore
+        job.text = None
+        if result.ok:
+            job.image = result
+        else:
+            logger.warning(
+                f"({job.j_short_name}) Error in word cloud generation: {result.error}"
+            )
+            job.status = RENDER_ERROR
+        return job
+
+    def post_entry(self, job):
+        """Last step: queue the word cloud for posting and store the status of the entry."""
+        if job.status is None:
+            ttl = self.make_title(
+                job.url,
+                job.j_short_name,
+                job.entry.title,
+            )
+            short_url = self.url_shortener.shorten(job.url)
+            self.post_queue.add(
+                ttl,
+                short_url,
+                job.image.filename,
+                entry=dict(url=job.url, journal=job.j_short_name, title=job.entry.title),
+                image=job.image.data,
+            )
+            job.image = None
+            # Marked as SUCCESS once the tweet is confirmed
+            job.status = POST_QUEUED
+        self.write_entry(
+            job.url, job.j_short_name, status=job.status, title=job.entry.get("title")
+        )
+        if job.status == POST_QUEUED:
+            # Do not sleep here: it would block all stages of the pipeline
+            self.process_post_queue(max_wait=0)
 
-                if new_entry:
-                    logger.info(f"({j_short_name}) New entry in: {url}")
-                    self.text = extract_text(
-                        url, self.browser_exec_dir, j_short_name, url_ready=False
-                    )
+    def process_post_queue(self, max_wait=None):
+        """
+        Send pending posts and store the status of their entries.
 
-                    if len(self.text) > self.minwords:
-                        self.generate_wc()
-                        if self.error_in_wordcloud_gen is None:
-                            imgname = self.img_file
-                            ttl = self.make_title(
-                                url,
-                                j_short_name,
-                                entry.title,
-                            )
-                            short_url = self.url_shortener.shorten(url)
-                            self.twitter_api.post_tweet(ttl, short_url, imgname)
-                            self.write_entry(url, j_short_name, status=SUCCESS)
-                            # time.sleep(10)
-                        else:
-                            logger.warning(
-                                f"({j_short_name}) Error in word cloud generation:"
-                                f" {self.error_in_wordcloud_gen}"
-                            )
-                    else:
-                        imgname = None
-                        logger.warning(
-                            f"({j_short_name}) Text length {len(self.text)}"
-                            f" is less than {self.minwords}"
-                        )
-                        if len(self.text) == 0:
-                            self.write_entry(url, j_short_name, status=NO_TEXT)
+        `max_wait` is passed to `PostQueue.process` (`post_max_wait` by default).
+        """
+
+        def on_posted(post, tweet_id):
+            if post["entry"] is not None:
+                logger.info(f"({post['entry']['journal']}) Posted tweet {tweet_id}")
+                self.write_entry(post["entry"]["url"], post["entry"]["journal"], status=SUCCESS)
+
+        def on_failed(post, error):
+            if post["entry"] is not None:
+                self.write_entry(
+                    post["entry"]["url"],
+                    post["entry"]["journal"],
+                    status=POST_ERROR,
+                    title=post["entry"].get("title"),
+                )
+
+        self.post_queue.process(on_posted=on_posted, on_failed=on_failed, max_wait=max_wait)
+
+    def run(self):
+        with open(self.j_list_path) as json_file:
+            self.j_list = json.load(json_file)
+
+        # self.handle_mentions()
+
+        self.DB = open_entry_store(os.path.join(curdir, self.db_file))
+        self.feed_cache = FeedCache(os.path.join(curdir, self.feed_cache_file))
+        self.fetch_router = FetchRouter(
+            os.path.join(curdir, self.fetch_stats_file),
+            min_success_rate=self.settings.get_fetch_min_success_rate(),
+            probe_interval=self.settings.get_fetch_probe_interval(),
+            min_samples=self.settings.get_fetch_min_samples(),
+        )
+
+        # Posts left from the previous runs
+        self.process_post_queue()
+
+        feeds = fetch_feeds(
+            self.http_client,
+            self.j_list,
+            max_workers=self.feed_workers,
+            timeout=self.feed_timeout,
+            cache=self.feed_cache,
+        )
+        new_entries, updated_feeds = self.select_new_entries(feeds)
+        logger.info(f"{len(new_entries)} new entries to process")
+
+        pipeline = Pipeline(
+            [
+                Stage("extract", self.extract_entry, workers=self.extract_workers),
+                Stage("render", self.render_entry, workers=self.renderer.workers),
+            ],
+            queue_size=self.pipeline_queue_size,
+        )
+        try:
+            # Entries are posted and stored in this thread
+            for job in pipeline.run(EntryJob(journ, entry) for journ, entry in new_entries):
+                self.post_entry(job)
+        finally:
+            self.browser_pool.close()
+            self.renderer.close()
+            self.fetch_router.save()
+        # Posts that were waiting for a retry or for the rate limit
+        self.process_post_queue()
+
+        if pipeline.errors > 0:
+            # Keep the feeds changed, so that the dropped entries are processed next time
+            logger.warning(f"{pipeline.errors} entries failed, feed cache is not updated")
+            return
+        # Only remember the feeds after all their entries have been handled
+        for journ, f in updated_feeds:
+            self.feed_cache.update(journ["rss"], f)
 
 
 if __name__ == "__main__":
@@ -358,13 +645,22 @@ if __name__ == "__main__":
         s.get_twitter_access_token(),
         s.get_twitter_access_token_secret(),
     )
+    (rate, burst), host_limits = s.get_rate_limits()
+    http_client = HttpClient(
+        timeout=(s.get_http_connect_timeout(), s.get_http_read_timeout()),
+        retries=s.get_http_retries(),
+        pool_maxsize=s.get_http_pool_size(),
+        rate_limiter=HostRateLimiter(rate, burst, host_limits=host_limits),
+    )
     url_shortener = UrlShortener(
         api_name=s.get_url_shortener_api(),
+        client=http_client,
         login=s.get_url_shortener_login(),
         api_key=s.get_url_shortener_key(),
     )
     logger.info("Initialised")
-    bot = AtmosSciBot(curdir, s, twitter_api, url_shortener)
+    bot = AtmosSciBot(curdir, s, twitter_api, url_shortener, http_client)
     logger.info("Run started")
     bot.run()
+    http_client.close()
     logger.info("Run finished")
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark encoding of word clouds: encoding time, size and upload time.
+
+Word clouds are rendered from the texts of the extraction fixtures
+(benchmarks/fixtures/) and encoded with each option.
+
+Usage:
+    python benchmarks/bench_encoding.py --bandwidth 10
+"""
+import argparse
+from glob import glob
+import json
+import os
+import sys
+import time
+
+curdir = os.path.dirname(os.path.realpath(__file__))
+rootdir = os.path.dirname(curdir)
+sys.path.insert(0, rootdir)
+sys.path.insert(0, curdir)
+from bench_extraction import extract  # noqa
+from extraction_rules import compile_rules  # noqa
+from font_manager import DEFAULT_FONT_PATH  # noqa
+from render_assets import RenderAssets  # noqa
+from word_frequencies import WordFrequencies  # noqa
+from wordcloud_renderer import encode_image  # noqa
+
+OPTIONS = [
+    ("png optimized", dict(image_format="png")),
+    ("png level 1", dict(image_format="png", compress_level=1)),
+    ("png level 6", dict(image_format="png", compress_level=6)),
+    ("palette 256", dict(image_format="palette", compress_level=6)),
+    ("palette 64", dict(image_format="palette", colors=64, compress_level=6)),
+    ("webp q85", dict(image_format="webp", quality=85)),
+    ("webp q70", dict(image_format="webp", quality=70)),
+    ("jpeg q85", dict(image_format="jpeg", quality=85)),
+    ("jpeg q70", dict(image_format="jpeg", quality=70)),
+]
+
+
+def load_texts(fixtures_dir, rules_file):
+    """Extract texts of all fixtures."""
+    with open(rules_file) as f:
+        rules = compile_rules(json.load(f))
+    texts = []
+    for name, rule in rules.items():
+        for fname in sorted(glob(os.path.join(fixtures_dir, name, "*"))):
+            with open(fname, "rb") as f:
+                text = extract(f.read(), rule)
+            if text:
+                texts.append(text)
+    return texts
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    ap.add_argument("--fixtures", default=os.path.join(curdir, "fixtures"))
+    ap.add_argument("--rules", default=os.path.join(rootdir, "extraction_rules.json"))
+    ap.add_argument("--width", type=int, default=1024)
+    ap.add_argument("--height", type=int, default=512)
+    ap.add_argument("-r", "--repeat", type=int, default=3)
+    ap.add_argument(
+        "--bandwidth", type=float, default=10, help="upload bandwidth (Mbit/s) for upload time"
+    )
+    args = ap.parse_args()
+
+    texts = load_texts(args.fixtures, args.rules)
+    word_frequencies = WordFrequencies(os.path.join(rootdir, "exclude_words"))
+    font = os.path.join(rootdir, DEFAULT_FONT_PATH)
+    assets = RenderAssets(os.path.join(rootdir, "stencils"), args.width, args.height)
+    stencils = sorted(assets.stencils)
+    images = []
+    for i, text in enumerate(texts):
+        wc = assets.get_renderer("viridis", stencils[i % len(stencils)], font)
+        images.append(wc.generate_from_frequencies(word_frequencies.get(text)).to_image())
+    print(f"{len(images)} word clouds of {args.width}x{args.height}")
+
+    print(f"{'option':<14} {'encode, ms':>10} {'size, KB':>9} {'upload, ms':>10}")
+    for name, kwargs in OPTIONS:
+        times = []
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            sizes = [len(encode_image(img, **kwargs)[0]) for img in images]
+            times.append((time.perf_counter() - t0) / len(images))
+        size = sum(sizes) / len(sizes)
+        upload = size * 8 / (args.bandwidth * 1e6)
+        print(f"{name:<14} {min(times) * 1e3:>10.1f} {size / 1024:>9.1f} {upload * 1e3:>10.1f}")
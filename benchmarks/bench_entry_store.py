@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark lookups and inserts of the processed-entries stores.
+
+Usage:
+    python benchmarks/bench_entry_store.py -n 100000 1000000 --tinydb-max 10000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from canonical_url import canonical_key  # noqa
+from entry_store import SQLiteEntryStore, TinyDBEntryStore  # noqa
+
+
+def fill(store, n_entries):
+    """Insert `n_entries` fake entries in bulk if possible."""
+    rows = [
+        (f"https://example.org/doi/10.1000/{i}", "TEST", 0, "20000101000000", 1, None, None)
+        for i in range(n_entries)
+    ]
+    if hasattr(store, "add_many"):
+        store.add_many(rows)
+    else:
+        store.db.insert_multiple(
+            dict(
+                key=canonical_key(u),
+                url=u,
+                journal_short_name=j,
+                status=s,
+                datetime=d,
+                attempts=a,
+                retry_after=r,
+                title=t,
+            )
+            for u, j, s, d, a, r, t in rows
+        )
+
+
+def bench(store_cls, n_entries, n_queries, tmpdir):
+    """Return mean lookup and insert times (in ms) for a store of `n_entries`."""
+    db_file = os.path.join(tmpdir, f"{store_cls.__name__}_{n_entries}.db")
+    if store_cls is TinyDBEntryStore:
+        db_file += ".json"
+    store = store_cls(db_file)
+    fill(store, n_entries)
+
+    t0 = time.perf_counter()
+    for i in range(n_queries):
+        # half of the queries are hits, half are misses
+        store.contains(f"https://example.org/doi/10.1000/{i * (n_entries // n_queries)}")
+        store.contains(f"https://example.org/doi/10.1000/new{i}")
+    lookup = (time.perf_counter() - t0) / (2 * n_queries) * 1e3
+
+    t0 = time.perf_counter()
+    for i in range(n_queries):
+        store.add(f"https://example.org/doi/10.1000/added{i}", "TEST", 0)
+    insert = (time.perf_counter() - t0) / n_queries * 1e3
+    store.close()
+    return lookup, insert
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    ap.add_argument("-n", type=int, nargs="+", default=[10**5, 10**6])
+    ap.add_argument("-q", "--queries", type=int, default=100)
+    ap.add_argument(
+        "--tinydb-max", type=int, default=10**4, help="skip TinyDB for larger stores"
+    )
+    args = ap.parse_args()
+
+    print(f"{'store':<20} {'entries':>10} {'lookup, ms':>12} {'insert, ms':>12}")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for n_entries in args.n:
+            for store_cls in [TinyDBEntryStore, SQLiteEntryStore]:
+                if store_cls is TinyDBEntryStore and n_entries > args.tinydb_max:
+                    continue
+                lookup, insert = bench(store_cls, n_entries, args.queries, tmpdir)
+                print(
+                    f"{store_cls.__name__:<20} {n_entries:>10} {lookup:>12.3f} {insert:>12.3f}"
+                )
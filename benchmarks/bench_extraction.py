@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark text extraction over stored publisher pages.
+
+Fixtures are stored in benchmarks/fixtures/<rule name>/, where the rule name is
+a key of extraction_rules.json. For each rule, the benchmark reports parse time,
+peak memory, number of extracted words and a hash of the text.
+
+Each timing runs the pages of a rule as many times as needed to take at least
+--min-time seconds, and the median of --repeat timings is reported. The timings
+are interleaved with a full parse of the same pages by BeautifulSoup, and the
+regression check compares the ratio of the two ("relative time"), so that it
+does not depend on the speed of the machine at the moment of the run.
+Rules that look slower than the baseline are measured again (--confirm) before
+a regression is reported.
+
+Usage:
+    python benchmarks/bench_extraction.py --save baseline.json
+    python benchmarks/bench_extraction.py --check baseline.json
+"""
+import argparse
+from glob import glob
+import hashlib
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+curdir = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.dirname(curdir))
+import bs4  # noqa
+from extraction_rules import compile_rules  # noqa
+from parse_article import NotOpenAccessError, text_from_soup  # noqa
+
+
+def extract(content, rule, fast=True):
+    """Extract text from the page according to the rule."""
+    try:
+        return text_from_soup(
+            content,
+            rule.parser,
+            rule.find_args,
+            rule.check_for_open_access,
+            between_children=rule.between_children,
+            escape_result=rule.escape_result,
+            fast=fast,
+        )
+    except NotOpenAccessError:
+        return ""
+
+
+def autorange(func, min_time):
+    """Find the number of calls of `func` that take at least `min_time` seconds."""
+    number = 1
+    while True:
+        t0 = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - t0
+        if elapsed >= min_time:
+            return number
+        # Aim a bit above min_time to avoid another doubling
+        number = max(number * 2, int(number * 1.2 * min_time / max(elapsed, 1e-9)))
+
+
+def time_interleaved(func, ref_func, number):
+    """
+    Time `number` calls of `func` and `ref_func`, alternating between them.
+
+    Returns
+    -------
+    t_func: float
+        Time (in seconds) per call of `func`
+    t_ref: float
+        Time (in seconds) per call of `ref_func`
+    """
+    t_func, t_ref = 0, 0
+    for _ in range(number):
+        t0 = time.perf_counter()
+        func()
+        t1 = time.perf_counter()
+        ref_func()
+        t_func += t1 - t0
+        t_ref += time.perf_counter() - t1
+    return t_func / number, t_ref / number
+
+
+def bench_rule(rule, fixtures, repeat, fast=True, min_time=0.05):
+    """Return timing, memory, word count and text hash for the fixtures of a rule."""
+    contents = []
+    for fname in fixtures:
+        with open(fname, "rb") as f:
+            contents.append(f.read())
+    n_bytes = sum(len(i) for i in contents)
+
+    texts = [extract(content, rule, fast=fast) for content in contents]
+    digest = hashlib.sha256("\n".join(texts).encode("utf-8")).hexdigest()
+
+    def run():
+        for content in contents:
+            extract(content, rule, fast=fast)
+
+    def run_reference():
+        for content in contents:
+            bs4.BeautifulSoup(content, rule.parser)
+
+    number = autorange(run, min_time)
+    timings = [time_interleaved(run, run_reference, number) for _ in range(repeat)]
+
+    tracemalloc.start()
+    for content in contents:
+        extract(content, rule, fast=fast)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    median = statistics.median(t for t, _ in timings)
+    return dict(
+        pages=len(contents),
+        loops=number,
+        time_ms=median * 1e3,
+        mb_per_s=n_bytes / 1024**2 / median if median > 0 else float("inf"),
+        relative_time=statistics.median(t / t_ref for t, t_ref in timings),
+        peak_mem_mb=peak / 1024**2,
+        words=sum(len(text.split()) for text in texts),
+        text_hash=digest,
+    )
+
+
+def is_slower(res, ref, tolerance):
+    """Check if the relative time is more than `tolerance` above the baseline."""
+    if "relative_time" not in ref:
+        # Baseline saved before relative times were measured
+        return res["mb_per_s"] < ref["mb_per_s"] * (1 - tolerance)
+    return res["relative_time"] > ref["relative_time"] * (1 + tolerance)
+
+
+def check(results, baseline, tolerance):
+    """Compare results with the baseline; return a list of regressions."""
+    errors = []
+    for name, res in results.items():
+        if name not in baseline:
+            continue
+        ref = baseline[name]
+        if res["text_hash"] != ref["text_hash"]:
+            errors.append(
+                f"{name}: extracted text changed ({ref['words']} -> {res['words']} words)"
+            )
+        if is_slower(res, ref, tolerance):
+            errors.append(
+                f"{name}: slower than the baseline"
+                f" (relative time {ref.get('relative_time', float('nan')):.3f}"
+                f" -> {res['relative_time']:.3f},"
+                f" {ref['mb_per_s']:.2f} -> {res['mb_per_s']:.2f} MB/s)"
+            )
+    return errors
+
+
+def print_result(name, res):
+    print(
+        f"{name:<12} {res['pages']:>5} {res['loops']:>5} {res['time_ms']:>10.2f}"
+        f" {res['mb_per_s']:>8.2f} {res['relative_time']:>8.3f} {res['peak_mem_mb']:>9.2f}"
+        f" {res['words']:>7}  {res['text_hash'][:12]}"
+    )
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    ap.add_argument("--fixtures", default=os.path.join(curdir, "fixtures"))
+    ap.add_argument(
+        "--rules", default=os.path.join(os.path.dirname(curdir), "extraction_rules.json")
+    )
+    ap.add_argument("-r", "--repeat", type=int, default=7, help="number of timings")
+    ap.add_argument(
+        "--min-time", type=float, default=0.05, help="minimum duration (s) of each timing"
+    )
+    ap.add_argument("--full-parse", action="store_true", help="disable the SoupStrainer path")
+    ap.add_argument("--save", help="save results to this JSON file")
+    ap.add_argument("--check", help="fail if results regress against this JSON file")
+    ap.add_argument(
+        "--tolerance", type=float, default=0.2, help="allowed relative increase of the time"
+    )
+    ap.add_argument(
+        "--confirm", type=int, default=2, help="number of re-runs of rules that look slower"
+    )
+    args = ap.parse_args()
+
+    with open(args.rules) as f:
+        rules = compile_rules(json.load(f))
+
+    def run_rule(name):
+        fixtures = sorted(glob(os.path.join(args.fixtures, name, "*")))
+        return bench_rule(
+            rules[name], fixtures, args.repeat, fast=not args.full_parse, min_time=args.min_time
+        )
+
+    results = {}
+    print(
+        f"{'rule':<12} {'pages':>5} {'loops':>5} {'time, ms':>10} {'MB/s':>8} {'relative':>8}"
+        f" {'peak, MB':>9} {'words':>7}  text hash"
+    )
+    for name in rules:
+        if len(glob(os.path.join(args.fixtures, name, "*"))) == 0:
+            continue
+        results[name] = run_rule(name)
+        print_result(name, results[name])
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=4)
+    if args.check:
+        with open(args.check) as f:
+            baseline = json.load(f)
+        for _ in range(args.confirm):
+            slower = [
+                name
+                for name, res in results.items()
+                if name in baseline and is_slower(res, baseline[name], args.tolerance)
+            ]
+            if len(slower) == 0:
+                break
+            print(f"Measuring {', '.join(slower)} again")
+            for name in slower:
+                res = run_rule(name)
+                print_result(name, res)
+                if res["relative_time"] < results[name]["relative_time"]:
+                    results[name] = res
+        errors = check(results, baseline, args.tolerance)
+        for err in errors:
+            print(f"REGRESSION {err}")
+        sys.exit(1 if errors else 0)
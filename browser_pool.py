@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""Pool of reusable headless browsers for pages that cannot be fetched by requests."""
+# Standard library
+import os
+import threading
+
+# Local modules
+from logger import logger
+
+
+class BrowserPool(object):
+    """
+    Lazily started pool of headless Firefox sessions driven by selenium.
+
+    Browsers are started on first use, reused for subsequent pages,
+    recycled after `max_pages` pages or after an error, and shut down by `close()`.
+
+    Arguments
+    ---------
+    exec_dir: str
+        Directory with firefox & geckodriver
+    size: int, optional
+        Maximum number of browsers running at the same time
+    max_pages: int, optional
+        Number of pages after which a browser is restarted
+    page_load_timeout: float, optional
+        Page load timeout (in seconds)
+    """
+
+    def __init__(self, exec_dir, size=1, max_pages=50, page_load_timeout=60):
+        self.exec_dir = exec_dir
+        self.max_pages = max_pages
+        self.page_load_timeout = page_load_timeout
+        self.slots = threading.BoundedSemaphore(size)
+        self.lock = threading.Lock()
+        self.idle = []
+
+    def start_browser(self):
+        """Start a new headless browser."""
+        from selenium import webdriver  # noqa
+        from selenium.webdriver.firefox.options import Options  # noqa
+        from selenium.webdriver.firefox.service import Service  # noqa
+
+        logger.info("Starting a headless browser")
+        options = Options()
+        options.add_argument("--headless")
+        service = Service(os.path.join(self.exec_dir, "geckodriver"))
+        driver = webdriver.Firefox(options=options, service=service)
+        driver.set_page_load_timeout(self.page_load_timeout)
+        return dict(driver=driver, pages=0)
+
+    def quit_browser(self, browser):
+        try:
+            browser["driver"].quit()
+        except Exception as e:
+            logger.info(f"Selenium exception {e} when closing the browser")
+
+    def get_page_source(self, url, before_request=None):
+        """
+        Load the page in one of the browsers and return its source.
+
+        Arguments
+        ---------
+        url: str
+            URL pointing to the page
+        before_request: callable, optional
+            Called with `url` just before the page is requested (e.g. rate limiting)
+
+        Returns
+        -------
+        content: str
+            Page source.
+        """
+        with self.slots:
+            with self.lock:
+                browser = self.idle.pop() if self.idle else None
+            if browser is None:
+                browser = self.start_browser()
+            try:
+                if before_request is not None:
+                    before_request(url)
+                browser["driver"].get(url)
+                content = browser["driver"].page_source
+                browser["pages"] += 1
+            except Exception:
+                # The browser may have crashed, so do not reuse it
+                self.quit_browser(browser)
+                raise
+            if browser["pages"] >= self.max_pages:
+                self.quit_browser(browser)
+            else:
+                with self.lock:
+                    self.idle.append(browser)
+        return content
+
+    def close(self):
+        """Shut down all idle browsers."""
+        with self.lock:
+            browsers, self.idle = self.idle, []
+        for browser in browsers:
+            self.quit_browser(browser)
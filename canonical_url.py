@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""Map links to journal articles to stable keys, preferably DOIs."""
+# Standard library
+import re
+import urllib.parse
+
+
+DOI_REGEX = re.compile(r"(10\.\d{4,9}/[^\s?#&]+)")
+# Copernicus (EGU) article IDs, e.g. acp-23-1234-2023
+EGU_ID_REGEX = re.compile(r"\b([a-z]+-\d+-\d+-\d{4})\b")
+# Copernicus article paths, e.g. /articles/23/1234/2023/
+EGU_PATH_REGEX = re.compile(r"^/articles/(\d+)/(\d+)/(\d{4})")
+EGU_DOI_PREFIX = "10.5194"
+# Nature (npj) article paths, e.g. /articles/s41612-023-00123-4
+NATURE_PATH_REGEX = re.compile(r"^/articles/(s\d{5}-\d{3}-\d{5}-\w)")
+NATURE_DOI_PREFIX = "10.1038"
+# Query parameters added by RSS feeds and trackers
+TRACKING_PARAMS = ["af", "rss", "ref", "src", "feed", "cmpid", "mi", "sessionid"]
+# Suffixes of the same page that `extract_text` appends or rewrites
+PAGE_SUFFIXES = ["/htm", "/full", "/abstract", "/abs", ".html", ".xml", ".pdf"]
+
+
+def find_doi(url):
+    """
+    Derive the DOI of an article from its URL.
+
+    Arguments
+    ---------
+    url: str
+        URL of the article
+
+    Returns
+    -------
+    doi: str or None
+        Lower-case DOI or None if it cannot be derived
+    """
+    parsed = urllib.parse.urlparse(url)
+    path = urllib.parse.unquote(parsed.path)
+    host = parsed.netloc.lower()
+
+    if host.endswith("copernicus.org"):
+        match = EGU_ID_REGEX.search(path)
+        if match is not None:
+            return f"{EGU_DOI_PREFIX}/{match.group(1)}".lower()
+        match = EGU_PATH_REGEX.match(path)
+        if match is not None:
+            journal = host.split(".")[0]
+            return f"{EGU_DOI_PREFIX}/{journal}-{'-'.join(match.groups())}".lower()
+
+    if host.endswith("nature.com"):
+        match = NATURE_PATH_REGEX.match(path)
+        if match is not None:
+            return f"{NATURE_DOI_PREFIX}/{match.group(1)}".lower()
+
+    match = DOI_REGEX.search(path) or DOI_REGEX.search(urllib.parse.unquote(parsed.query))
+    if match is not None:
+        doi = match.group(1).rstrip("/")
+        for suffix in PAGE_SUFFIXES:
+            if doi.endswith(suffix):
+                doi = doi[: -len(suffix)]
+        return doi.lower()
+    return None
+
+
+def normalise_url(url):
+    """
+    Normalise a URL: https scheme, lower-case host without "www.",
+    no fragment, no tracking query parameters and no page suffixes.
+    """
+    parsed = urllib.parse.urlparse(url.strip())
+    host = parsed.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    path = parsed.path.replace("/doi/abs/", "/doi/").replace("/doi/full/", "/doi/")
+    path = path.rstrip("/")
+    for suffix in PAGE_SUFFIXES:
+        if path.endswith(suffix):
+            path = path[: -len(suffix)]
+    query = [
+        (k, v)
+        for k, v in urllib.parse.parse_qsl(parsed.query)
+        if not (k.lower() in TRACKING_PARAMS or k.lower().startswith("utm_"))
+    ]
+    return urllib.parse.urlunparse(
+        ("https", host, path, "", urllib.parse.urlencode(sorted(query)), "")
+    )
+
+
+def canonical_key(url):
+    """
+    Get a stable key of an article, the same for all links pointing to it.
+
+    Returns "doi:<doi>" if the DOI can be derived from the URL,
+    otherwise "url:<normalised url>".
+    """
+    doi = find_doi(url)
+    if doi is not None:
+        return f"doi:{doi}"
+    return f"url:{normalise_url(url)}"
@@ -0,0 +1,353 @@
+# -*- coding: utf-8 -*-
+"""
+Storage of the processed feed entries.
+
+Entries are identified by the canonical key of their URL (see `canonical_url`),
+so that different links to the same article are not processed twice.
+Entries that failed can have a `retry_after` timestamp, after which
+they are considered new again. Their title is stored too, so that they can
+be retried even if they are not in the feed anymore (see `due`).
+
+The default backend is an SQLite database with a unique index on the key,
+so that lookups and inserts do not depend on the number of stored entries.
+The legacy TinyDB backend is kept for existing JSON files.
+
+To migrate an existing TinyDB file, run:
+
+    python entry_store.py processed_entries.json processed_entries.sqlite
+
+To recompute the keys of existing records, run:
+
+    python entry_store.py --rekey processed_entries.sqlite
+"""
+# Standard library
+import argparse
+from datetime import datetime
+import json
+import os
+import sqlite3
+
+# External packages
+from tinydb import TinyDB, where
+
+# Local modules
+from canonical_url import canonical_key
+
+
+def utc_tstamp():
+    """Current UTC time in the format used by the stores."""
+    return datetime.utcnow().strftime("%Y%m%d%H%M%S")
+
+
+def is_due(record, now):
+    """Check if the record of a failed entry is due for a retry."""
+    return record.get("retry_after") is not None and record["retry_after"] <= now
+
+
+class TinyDBEntryStore(object):
+    """Processed entries stored in a TinyDB JSON file (linear scans)."""
+
+    def __init__(self, db_file):
+        self.db_file = db_file
+        self.db = TinyDB(db_file)
+        if not all("key" in i for i in self.db.all()):
+            self.rekey()
+
+    def get(self, url):
+        """Get the record of the entry with this URL (None if not found)."""
+        query_result = self.db.search(where("key") == canonical_key(url))
+        if len(query_result) == 0:
+            return None
+        return dict(query_result[0])
+
+    def contains(self, url):
+        """Check if the entry with this URL has been processed and is not due for a retry."""
+        record = self.get(url)
+        return record is not None and not is_due(record, utc_tstamp())
+
+    def add(
+        self,
+        url,
+        journal_short_name,
+        status,
+        tstamp=None,
+        attempts=1,
+        retry_after=None,
+        title=None,
+    ):
+        """Record a processed entry (or update the existing record)."""
+        if tstamp is None:
+            tstamp = utc_tstamp()
+        key = canonical_key(url)
+        self.db.upsert(
+            dict(
+                journal_short_name=journal_short_name,
+                key=key,
+                url=url,
+                status=status,
+                datetime=tstamp,
+                attempts=attempts,
+                retry_after=retry_after,
+                title=title,
+            ),
+            where("key") == key,
+        )
+
+    def keys(self):
+        """Get the set of canonical keys of processed entries not due for a retry."""
+        now = utc_tstamp()
+        return {i["key"] for i in self.db.all() if "key" in i and not is_due(i, now)}
+
+    def due(self):
+        """Get the records of failed entries that are due for a retry."""
+        now = utc_tstamp()
+        return [dict(i) for i in self.db.all() if "key" in i and is_due(i, now)]
+
+    def rekey(self):
+        """
+        Recompute canonical keys of all records.
+
+        If several records map to the same key, only the most recent one is kept.
+        The new table is written to a temporary file, which then replaces the
+        database file, so the records are not lost if the process is killed.
+
+        Returns
+        -------
+        n_entries: int
+            Number of records left.
+        """
+        records = sorted(self.db.all(), key=lambda i: (i.get("datetime") or "", i.doc_id))
+        latest = {}
+        others = []
+        for record in records:
+            if "url" in record:
+                latest[canonical_key(record["url"])] = record
+            else:
+                others.append(dict(record))
+        rows = others + [dict(record, key=key) for key, record in latest.items()]
+        # Keep the other tables of the file, if any
+        data = self.db.storage.read() or {}
+        data[self.db.default_table_name] = {str(i): row for i, row in enumerate(rows, 1)}
+        self.db.close()
+        tmp_file = self.db_file + ".tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.db_file)
+        self.db = TinyDB(self.db_file)
+        return len(latest)
+
+    def all(self):
+        """Get all processed entries as a list of dictionaries."""
+        return self.db.all()
+
+    def close(self):
+        self.db.close()
+
+
+class SQLiteEntryStore(object):
+    """Processed entries stored in an SQLite database indexed by URL."""
+
+    def __init__(self, db_file):
+        self.db = sqlite3.connect(db_file)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT,"
+            " url TEXT NOT NULL,"
+            " journal_short_name TEXT,"
+            " status INTEGER,"
+            " datetime TEXT,"
+            " attempts INTEGER DEFAULT 1,"
+            " retry_after TEXT,"
+            " title TEXT"
+            ")"
+        )
+        columns = [row[1] for row in self.db.execute("PRAGMA table_info(entries)")]
+        if "attempts" not in columns:
+            # Database created before failed entries were retried
+            self.db.execute("ALTER TABLE entries ADD COLUMN attempts INTEGER DEFAULT 1")
+            self.db.execute("ALTER TABLE entries ADD COLUMN retry_after TEXT")
+        if "title" not in columns:
+            # Database created before failed entries were retried from the store
+            self.db.execute("ALTER TABLE entries ADD COLUMN title TEXT")
+        if "key" not in columns:
+            # Database created before entries were identified by canonical keys
+            self.db.execute("ALTER TABLE entries ADD COLUMN key TEXT")
+            self.rekey()
+        self.db.execute("CREATE UNIQUE INDEX IF NOT EXISTS entries_key ON entries (key)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS entries_url ON entries (url)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS entries_retry ON entries (retry_after)")
+        self.db.commit()
+
+    def get(self, url):
+        """Get the record of the entry with this URL (None if not found)."""
+        cur = self.db.execute("SELECT * FROM entries WHERE key = ?", (canonical_key(url),))
+        row = cur.fetchone()
+        if row is None:
+            return None
+        return dict(row)
+
+    def contains(self, url):
+        """Check if the entry with this URL has been processed and is not due for a retry."""
+        cur = self.db.execute(
+            "SELECT 1 FROM entries WHERE key = ?"
+            " AND (retry_after IS NULL OR retry_after > ?)",
+            (canonical_key(url), utc_tstamp()),
+        )
+        return cur.fetchone() is not None
+
+    def add(
+        self,
+        url,
+        journal_short_name,
+        status,
+        tstamp=None,
+        attempts=1,
+        retry_after=None,
+        title=None,
+    ):
+        """Record a processed entry (or update the existing record)."""
+        if tstamp is None:
+            tstamp = utc_tstamp()
+        self.add_many(
+            [(url, journal_short_name, status, tstamp, attempts, retry_after, title)]
+        )
+
+    def add_many(self, rows):
+        """
+        Record many entries at once.
+
+        Each row is a
+        (url, journal_short_name, status, datetime, attempts, retry_after, title) tuple.
+        """
+        with self.db:
+            self.db.executemany(
+                "INSERT INTO entries"
+                " (key, url, journal_short_name, status, datetime, attempts, retry_after,"
+                " title)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT (key) DO UPDATE SET"
+                " url = excluded.url,"
+                " journal_short_name = excluded.journal_short_name,"
+                " status = excluded.status,"
+                " datetime = excluded.datetime,"
+                " attempts = excluded.attempts,"
+                " retry_after = excluded.retry_after,"
+                " title = excluded.title",
+                [(canonical_key(row[0]), *row) for row in rows],
+            )
+
+    def keys(self):
+        """Get the set of canonical keys of processed entries not due for a retry."""
+        cur = self.db.execute(
+            "SELECT key FROM entries WHERE retry_after IS NULL OR retry_after > ?",
+            (utc_tstamp(),),
+        )
+        return {row[0] for row in cur}
+
+    def due(self):
+        """Get the records of failed entries that are due for a retry."""
+        cur = self.db.execute(
+            "SELECT * FROM entries WHERE retry_after IS NOT NULL AND retry_after <= ?",
+            (utc_tstamp(),),
+        )
+        return [dict(row) for row in cur]
+
+    def rekey(self):
+        """
+        Recompute canonical keys of all records.
+
+        If several records map to the same key, only the most recent one is kept.
+
+        Returns
+        -------
+        n_entries: int
+            Number of records left.
+        """
+        rows = self.db.execute(
+            "SELECT rowid, url FROM entries ORDER BY datetime, rowid"
+        ).fetchall()
+        latest = {}
+        for rowid, url in rows:
+            latest[canonical_key(url)] = rowid
+        with self.db:
+            self.db.execute("DROP INDEX IF EXISTS entries_key")
+            self.db.executemany(
+                "UPDATE entries SET key = ? WHERE rowid = ?", list(latest.items())
+            )
+            duplicates = set(rowid for rowid, _ in rows) - set(latest.values())
+            self.db.executemany(
+                "DELETE FROM entries WHERE rowid = ?", [(i,) for i in duplicates]
+            )
+            self.db.execute("CREATE UNIQUE INDEX entries_key ON entries (key)")
+        return len(latest)
+
+    def all(self):
+        """Get all processed entries as a list of dictionaries."""
+        return [dict(row) for row in self.db.execute("SELECT * FROM entries")]
+
+    def close(self):
+        self.db.close()
+
+
+def open_entry_store(db_file):
+    """Open the store of processed entries; JSON files use the TinyDB backend."""
+    if db_file.endswith(".json"):
+        return TinyDBEntryStore(db_file)
+    return SQLiteEntryStore(db_file)
+
+
+def migrate_from_tinydb(json_file, db_file):
+    """
+    Copy processed entries from a TinyDB file to an SQLite database.
+
+    Arguments
+    ---------
+    json_file: str
+        Path to the TinyDB JSON file
+    db_file: str
+        Path to the SQLite database (created if it does not exist)
+
+    Returns
+    -------
+    n_entries: int
+        Number of migrated entries.
+    """
+    src = TinyDB(json_file)
+    dst = SQLiteEntryStore(db_file)
+    rows = [
+        (
+            i["url"],
+            i.get("journal_short_name"),
+            i.get("status"),
+            i.get("datetime"),
+            i.get("attempts", 1),
+            i.get("retry_after"),
+            i.get("title"),
+        )
+        for i in src.all()
+        if "url" in i
+    ]
+    dst.add_many(rows)
+    src.close()
+    dst.close()
+    return len(rows)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Migrate or rekey processed entries")
+    ap.add_argument("--rekey", action="store_true", help="recompute keys of db_file")
+    ap.add_argument("json_file", nargs="?", help="TinyDB JSON file to migrate")
+    ap.add_argument("db_file", help="SQLite (or TinyDB) database file")
+    args = ap.parse_args()
+    if args.rekey:
+        store = open_entry_store(args.db_file)
+        n_entries = store.rekey()
+        store.close()
+        print(f"{n_entries} entries rekeyed in {args.db_file}.")
+    else:
+        n_entries = migrate_from_tinydb(args.json_file, args.db_file)
+        print(f"{n_entries} entries migrated to {args.db_file}.")
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+Registry of publisher rules for extracting the text of articles.
+
+The rules are defined in `extraction_rules.json` and assigned to journals
+by the "rule" key of the entries in `journal_list.json`. Each rule has:
+
+* "parser": HTML/XML parser, used by beautifulsoup
+* "find_args": tag names and attributes from which the text is extracted
+* "url" (optional): how to get the document URL from the RSS link,
+  e.g. {"rewrite": "append_suffix", "suffix": "/htm"} (see `URL_REWRITERS`)
+* "check_for_open_access", "between_children", "escape_result" (optional):
+  passed to `parse_article.text_from_soup`
+* "extends" (optional): name of a rule whose keys are inherited
+"""
+# Standard library
+import json
+import os
+import threading
+import urllib.parse
+
+
+def copernicus_xml(parsed_link, journal):
+    """Link to the XML version of an EGU article."""
+    netloc = "http://{}.copernicus.org/articles".format(journal.lower())
+    path_split = [s for s in parsed_link.path.split("/") if s]
+    _sub_path = "/".join(path_split[1].split("-")[1:])
+    return "{}/{}/{}.xml".format(netloc, _sub_path, path_split[1])
+
+
+def replace_path(parsed_link, journal, old, new, drop_query=False):
+    """Replace a part of the URL path and optionally drop the query."""
+    kw = dict(path=parsed_link.path.replace(old, new))
+    if drop_query:
+        kw["query"] = ""
+    return parsed_link._replace(**kw).geturl()
+
+
+def append_suffix(parsed_link, journal, suffix):
+    """Append a suffix to the URL if it is not there."""
+    if parsed_link.geturl().endswith(suffix):
+        return parsed_link.geturl()
+    return parsed_link.geturl() + suffix
+
+
+URL_REWRITERS = {
+    "copernicus_xml": copernicus_xml,
+    "replace_path": replace_path,
+    "append_suffix": append_suffix,
+}
+
+
+class ExtractionRule(object):
+    """Compiled rule: URL rewriter and arguments of `text_from_soup`."""
+
+    def __init__(
+        self,
+        name,
+        parser,
+        find_args,
+        url=None,
+        check_for_open_access=None,
+        between_children=None,
+        escape_result=None,
+        **kwargs,
+    ):
+        if kwargs:
+            # e.g. a typo that would silently disable a filter
+            raise ValueError(f"Unknown keys {', '.join(sorted(kwargs))} in rule {name}")
+        self.name = name
+        self.parser = parser
+        self.find_args = find_args
+        self.check_for_open_access = check_for_open_access
+        self.between_children = between_children
+        self.escape_result = escape_result
+
+        url = dict(url or {})
+        rewrite = url.pop("rewrite", None)
+        self.even_if_ready = url.pop("even_if_ready", False)
+        self.rewriter_kwargs = url
+        if rewrite is None:
+            self.rewriter = None
+        elif rewrite in URL_REWRITERS:
+            self.rewriter = URL_REWRITERS[rewrite]
+        else:
+            raise ValueError(f"Unknown URL rewriter {rewrite} in rule {name}")
+
+    def get_doc_url(self, url, journal, url_ready=False):
+        """
+        Get the URL of the document to be parsed.
+
+        Arguments
+        ---------
+        url: str
+            URL pointing to the page
+        journal: str
+            Journal short name
+        url_ready: bool
+            If False, the `url` is modified according to the rule.
+        """
+        parsed_link = urllib.parse.urlparse(url)
+        if self.rewriter is None or (url_ready and not self.even_if_ready):
+            return parsed_link.geturl()
+        return self.rewriter(parsed_link, journal, **self.rewriter_kwargs)
+
+
+def compile_rules(rules):
+    """Compile rule definitions into a dictionary of ExtractionRule instances."""
+
+    def resolve(name, seen=()):
+        if name in seen:
+            raise ValueError(f"Circular 'extends' in rule {name}")
+        definition = dict(rules[name])
+        parent = definition.pop("extends", None)
+        if parent is not None:
+            definition = {**resolve(parent, seen + (name,)), **definition}
+        return definition
+
+    compiled = {}
+    for name in rules:
+        definition = resolve(name)
+        definition.pop("publisher", None)
+        compiled[name] = ExtractionRule(name, **definition)
+    return compiled
+
+
+class RuleRegistry(object):
+    """
+    Map journal short names to compiled extraction rules.
+
+    Both files are reloaded if they are modified, so that the rules can be changed
+    in a long-running process.
+
+    Arguments
+    ---------
+    rules_file: str
+        Path to the JSON file with rule definitions
+    j_list_path: str
+        Path to the JSON file with the list of journals
+    """
+
+    def __init__(self, rules_file, j_list_path):
+        self.rules_file = rules_file
+        self.j_list_path = j_list_path
+        self.lock = threading.Lock()
+        self.mtimes = None
+        self.journals = {}
+        self.reload_if_changed()
+
+    def get_mtimes(self):
+        return (os.path.getmtime(self.rules_file), os.path.getmtime(self.j_list_path))
+
+    def reload_if_changed(self):
+        """Compile the rules again if any of the files has changed."""
+        mtimes = self.get_mtimes()
+        with self.lock:
+            if mtimes == self.mtimes:
+                return
+            with open(self.rules_file) as f:
+                rules = compile_rules(json.load(f))
+            with open(self.j_list_path) as f:
+                j_list = json.load(f)
+            self.journals = {
+                j["short_name"].upper(): rules[j["rule"]] for j in j_list if "rule" in j
+            }
+            self.mtimes = mtimes
+
+    def get(self, journal):
+        """Get the rule of a journal (None if there is no rule for it)."""
+        self.reload_if_changed()
+        return self.journals.get(journal.upper())
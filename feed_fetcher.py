@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""Download and parse RSS feeds of the journals concurrently."""
+# Standard library
+from concurrent.futures import ThreadPoolExecutor
+
+# External packages
+import feedparser as fp
+import requests
+from tinydb import TinyDB, where
+
+# Local modules
+from logger import logger
+
+
+def entry_id(entry):
+    """Get a stable identifier of a feed entry."""
+    return entry.get("id") or entry.get("link")
+
+
+class FeedCache(object):
+    """
+    Persistent cache of RSS feeds.
+
+    Stores the HTTP validators (ETag and Last-Modified) of each feed,
+    so that it can be polled with a conditional request,
+    and the IDs of the last parsed entries.
+    """
+
+    def __init__(self, db_file):
+        self.db = TinyDB(db_file)
+
+    def get(self, rss):
+        """Get the cached record of a feed (empty dict if not cached)."""
+        query_result = self.db.search(where("rss") == rss)
+        if len(query_result) == 0:
+            return {}
+        return query_result[0]
+
+    def is_unchanged(self, rss, feed):
+        """Check if the feed has the same entries as the last time."""
+        entry_ids = sorted(filter(None, map(entry_id, feed.entries)))
+        return len(entry_ids) > 0 and self.get(rss).get("entry_ids") == entry_ids
+
+    def update(self, rss, feed):
+        """Store the validators and entry IDs of the feed."""
+        record = dict(
+            rss=rss,
+            etag=feed.get("etag"),
+            modified=feed.get("modified"),
+            entry_ids=sorted(filter(None, map(entry_id, feed.entries))),
+        )
+        self.db.upsert(record, where("rss") == rss)
+
+
+def fetch_feed(client, rss, timeout=None, etag=None, modified=None):
+    """
+    Download and parse an RSS feed.
+
+    If `etag` or `modified` are given, the request is conditional,
+    and an empty feed with status 304 is returned if the feed is unchanged.
+
+    Arguments
+    ---------
+    client: http_client.HttpClient
+        Shared HTTP client
+    rss: str
+        URL of the RSS feed
+    timeout: float, optional
+        Connect and read timeout (in seconds) of the HTTP request.
+        By default, the timeout of the client is used.
+    etag: str, optional
+        ETag of the previously downloaded feed
+    modified: str, optional
+        Last-Modified header of the previously downloaded feed
+
+    Returns
+    -------
+    feed: feedparser.FeedParserDict or None
+        Parsed feed or None if the download failed.
+        Like in `feedparser.parse()`, it has `status`, `etag` and `modified` keys.
+    """
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if modified:
+        headers["If-Modified-Since"] = modified
+    try:
+        req = client.get(
+            rss, headers=headers, timeout=timeout or client.timeout, rate_limited=False
+        )
+        req.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        logger.info(f"Requests exception {e} when fetching {rss}")
+        return None
+    if req.status_code == 304:
+        feed = fp.FeedParserDict(entries=[], etag=etag, modified=modified)
+    else:
+        feed = fp.parse(req.content, response_headers=dict(req.headers))
+        feed["etag"] = req.headers.get("ETag")
+        feed["modified"] = req.headers.get("Last-Modified")
+    feed["status"] = req.status_code
+    return feed
+
+
+def fetch_feeds(client, j_list, max_workers=8, timeout=None, cache=None):
+    """
+    Download and parse RSS feeds of all journals concurrently.
+
+    Feeds are fetched by a thread pool, so the total time is bound by the
+    slowest feed rather than by the sum of all feeds; the timeout ensures
+    that a hung publisher cannot stall the run.
+
+    Arguments
+    ---------
+    client: http_client.HttpClient
+        Shared HTTP client
+    j_list: list
+        List of journals (see `journal_list.json`)
+    max_workers: int, optional
+        Number of threads downloading the feeds
+    timeout: float, optional
+        Connect and read timeout (in seconds) of each HTTP request
+        (by default, the timeout of the client)
+    cache: FeedCache, optional
+        If given, feeds are requested conditionally using the cached validators
+
+    Yields
+    ------
+    journ: dict
+        Journal description
+    feed: feedparser.FeedParserDict or None
+        Parsed feed or None if the download failed.
+        Feeds are yielded in the order of `j_list`.
+    """
+    validators = []
+    for journ in j_list:
+        cached = cache.get(journ["rss"]) if cache is not None else {}
+        validators.append((cached.get("etag"), cached.get("modified")))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(fetch_feed, client, journ["rss"], timeout, etag, modified)
+            for journ, (etag, modified) in zip(j_list, validators)
+        ]
+        for journ, future in zip(j_list, futures):
+            try:
+                feed = future.result()
+            except Exception as e:
+                logger.error(f"({journ['short_name']}) Exception {e} when parsing RSS")
+                feed = None
+            yield journ, feed
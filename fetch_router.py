@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""Choose how to fetch article pages based on per-host statistics."""
+# Standard library
+import threading
+import time
+import urllib.parse
+
+# External packages
+from tinydb import TinyDB, where
+
+
+# Fetch tiers, from the cheapest to the most expensive
+HTTP = "http"
+BROWSER = "browser"
+FETCH_TIERS = [HTTP, BROWSER]
+# Status codes meaning that the host blocks the tier (e.g. bot protection);
+# other errors, such as 404 or 5xx, say nothing about the tier
+BLOCKED_STATUS_CODES = [401, 403, 429]
+
+
+class FetchRouter(object):
+    """
+    Route page requests to the cheapest fetch tier that works for the host.
+
+    For each host and tier, the router keeps exponentially weighted averages
+    of the success rate and the latency. The success rate of a new host starts
+    from `prior`, and a tier is skipped only after `min_samples` requests if its
+    success rate is below `min_success_rate`, so a single failed request does not
+    change the route. Skipped tiers are probed again when their statistics are
+    older than `probe_interval`.
+    The statistics are stored in a TinyDB file by `save()`.
+
+    Arguments
+    ---------
+    db_file: str
+        Path to the TinyDB file with the statistics
+    min_success_rate: float, optional
+        Success rate below which a tier is skipped
+    probe_interval: float, optional
+        Time (in hours) after which a skipped tier is tried again
+    weight: float, optional
+        Weight of the latest request in the averages
+    min_samples: int, optional
+        Number of requests before a tier can be skipped
+    prior: float, optional
+        Initial success rate of a tier
+    """
+
+    def __init__(
+        self,
+        db_file,
+        min_success_rate=0.5,
+        probe_interval=24,
+        weight=0.3,
+        min_samples=3,
+        prior=1.0,
+    ):
+        self.db = TinyDB(db_file)
+        self.min_success_rate = min_success_rate
+        self.probe_interval = probe_interval * 3600
+        self.weight = weight
+        self.min_samples = min_samples
+        self.prior = prior
+        self.lock = threading.Lock()
+        self.stats = {i["host"]: i["tiers"] for i in self.db.all()}
+        self.updated_hosts = set()
+
+    @staticmethod
+    def get_host(url):
+        return urllib.parse.urlparse(url).netloc.lower()
+
+    def route(self, url):
+        """Get the list of tiers to try for this URL, in order."""
+        with self.lock:
+            stats = self.stats.get(self.get_host(url), {})
+            now = time.time()
+            for i, tier in enumerate(FETCH_TIERS):
+                tier_stats = stats.get(tier)
+                if (
+                    tier_stats is None
+                    or tier_stats.get("samples", 1) < self.min_samples
+                    or tier_stats["success_rate"] >= self.min_success_rate
+                ):
+                    return FETCH_TIERS[i:]
+                if now - tier_stats["updated"] > self.probe_interval:
+                    # Time to check if this tier works again
+                    return FETCH_TIERS[i:]
+            # Nothing has been working, so try everything
+            return FETCH_TIERS
+
+    def record(self, url, tier, success, latency):
+        """
+        Update the statistics of a tier after a request.
+
+        Only requests that were answered or blocked by the host should be
+        recorded: a missing article (404) or a server error is not a failure
+        of the tier.
+        """
+        host = self.get_host(url)
+        with self.lock:
+            tier_stats = self.stats.setdefault(host, {}).get(tier)
+            if tier_stats is None:
+                tier_stats = dict(success_rate=self.prior, latency=latency, samples=0)
+            w = self.weight
+            tier_stats["success_rate"] = w * success + (1 - w) * tier_stats["success_rate"]
+            tier_stats["latency"] = w * latency + (1 - w) * tier_stats["latency"]
+            # Statistics stored before the number of samples was counted
+            tier_stats["samples"] = tier_stats.get("samples", 1) + 1
+            tier_stats["updated"] = time.time()
+            self.stats[host][tier] = tier_stats
+            self.updated_hosts.add(host)
+
+    def save(self):
+        """Store the statistics of the hosts updated since the last save."""
+        with self.lock:
+            for host in self.updated_hosts:
+                self.db.upsert(dict(host=host, tiers=self.stats[host]), where("host") == host)
+            self.updated_hosts = set()
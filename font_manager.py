@@ -4,54 +4,193 @@
 from glob import glob
 import os
 import subprocess as sb
+import threading
+import time
+
+# External packages
+from tinydb import TinyDB, where
 
 # Local modules
 from logger import logger
 
 DEFAULT_FONT_PATH = "fonts/Chicle/Chicle-Regular.ttf"
 GOOGLEFONT_DOWNLOAD_SCRIPT = "../google-font-download/google-font-download"
-ALL_EXTENSIONS = ["woff2", "woff", "eot", "svg", "ttf"]
+GOOGLEFONT_DIR = "googlefonts"
 FONT_EXTENSIONS = ["otf", "ttf"]
 
 
-def get_font(font_name):
-    """Try to download a regular font from Google Fonts or use the default one."""
+def normalise_font_name(font_name):
+    """Font name used as the key of the index, e.g. " Open  sans" -> "open sans"."""
+    return " ".join(font_name.split()).lower()
+
+
+class FontIndex(object):
+    """
+    Persistent index of downloaded Google fonts.
+
+    Each record keeps the font name, paths of its files, their total size and
+    the time of the last use. The least recently used fonts are deleted when
+    the total size exceeds `max_size`. Names that could not be downloaded are
+    remembered for `negative_ttl` hours, so the download script is not run
+    again for them.
+
+    Arguments
+    ---------
+    db_file: str
+        Path to the TinyDB file with the index
+    max_size: float, optional
+        Maximum total size (in MB) of the downloaded fonts
+    negative_ttl: float, optional
+        Time (in hours) during which a failed font name is not downloaded again
+    """
+
+    def __init__(self, db_file, max_size=100, negative_ttl=24):
+        self.db = TinyDB(db_file)
+        self.max_size = max_size * 1024**2
+        self.negative_ttl = negative_ttl * 3600
+        self.lock = threading.Lock()
+
+    def lookup(self, font_name):
+        """
+        Find a font in the index.
+
+        Returns
+        -------
+        path: str or None
+            Path to the font file or None if the font is not in the index
+        failed: bool
+            True if the font recently failed to download
+        """
+        name = normalise_font_name(font_name)
+        with self.lock:
+            record = self.db.get(where("name") == name)
+            if record is None:
+                return None, False
+            if record.get("failed"):
+                if time.time() - record["last_used"] < self.negative_ttl:
+                    return None, True
+                self.db.remove(where("name") == name)
+                return None, False
+            if not os.path.isfile(record["path"]):
+                self.db.remove(where("name") == name)
+                return None, False
+            self.db.update(dict(last_used=time.time()), where("name") == name)
+            return record["path"], False
+
+    def add(self, font_name, path, files):
+        """Add a downloaded font and evict the least recently used ones if needed."""
+        name = normalise_font_name(font_name)
+        size = sum(os.path.getsize(f) for f in files if os.path.isfile(f))
+        record = dict(name=name, path=path, files=files, size=size, last_used=time.time())
+        with self.lock:
+            self.db.upsert(record, where("name") == name)
+            self.evict()
+
+    def add_failure(self, font_name):
+        """Remember that a font could not be downloaded."""
+        name = normalise_font_name(font_name)
+        with self.lock:
+            record = dict(name=name, failed=True, last_used=time.time())
+            self.db.upsert(record, where("name") == name)
+
+    def evict(self):
+        """Delete the least recently used fonts until they fit `max_size`."""
+        records = [i for i in self.db.all() if not i.get("failed")]
+        total_size = sum(i["size"] for i in records)
+        for record in sorted(records, key=lambda i: i["last_used"])[:-1]:
+            if total_size <= self.max_size:
+                break
+            for fname in record["files"]:
+                try:
+                    os.remove(fname)
+                except OSError:
+                    pass
+            self.db.remove(where("name") == record["name"])
+            total_size -= record["size"]
+            logger.info(f"Removed font {record['name']} from the cache")
+
+
+def download_font(font_name, curdir):
+    """
+    Download a regular font from Google Fonts.
+
+    Returns
+    -------
+    files: list
+        Paths to the downloaded font files (all formats); empty if the download failed
+    """
+    script = os.path.join(curdir, GOOGLEFONT_DOWNLOAD_SCRIPT)
+    p = sb.run([script, "{}:400".format(font_name)])
+    if p.returncode != 0:
+        logger.error(f"Error {p.returncode} in running {script}")
+        return []
+    # move font files to a separate directory
+    font_dir = os.path.join(curdir, GOOGLEFONT_DIR)
+    if not os.path.isdir(font_dir):
+        os.mkdir(font_dir)
+    files = []
+    pattern = "{}_400.*".format(font_name.replace(" ", "_"))
+    for f in glob(os.path.join(os.path.expanduser("~"), pattern)):
+        try:
+            new_name = os.path.join(font_dir, os.path.basename(f))
+            os.rename(f, new_name)
+            files.append(new_name)
+        except Exception as e:
+            logger.error(f"Error when moving {f}: {e}")
+    return files
+
+
+def find_downloaded_font(font_name, curdir):
+    """Find files of a font downloaded before the index was used."""
+    pattern = "{}_400.*".format(font_name.replace(" ", "_"))
+    return sorted(glob(os.path.join(curdir, GOOGLEFONT_DIR, pattern)))
+
+
+def get_font(font_name, index=None):
+    """
+    Try to download a regular font from Google Fonts or use the default one.
+
+    Arguments
+    ---------
+    font_name: str or None
+        Name of a Google font; None for the default font
+    index: FontIndex, optional
+        Index of downloaded fonts. If given, fonts in the index are used
+        without running the download script.
+
+    Returns
+    -------
+    str
+        Path to the font file
+    """
     curdir = os.path.dirname(os.path.realpath(__file__))
     default = os.path.join(curdir, DEFAULT_FONT_PATH)
-    if font_name is None:
+    if font_name is None or not font_name.strip():
         logger.info("Using default font")
         return default
+    font_name = font_name.strip()
+    if index is not None:
+        path, failed = index.lookup(font_name)
+        if path is not None:
+            return path
+        if failed:
+            logger.info(f"Font {font_name} failed recently, using default font")
+            return default
     try:
-        script = os.path.join(curdir, GOOGLEFONT_DOWNLOAD_SCRIPT)
-        p = sb.run([script, "{}:400".format(font_name)])
-        if p.returncode == 0:
-            files = []
-            for ext in ALL_EXTENSIONS:
-                # move font files to a separate directory
-                font_dir = os.path.join(curdir, "googlefonts")
-                if not os.path.isdir(font_dir):
-                    os.mkdir(font_dir)
-                for f in glob(
-                    os.path.join(
-                        os.path.expanduser("~"), "{}_400.*".format(font_name.replace(" ", "_"))
-                    )
-                ):
-                    try:
-                        new_name = os.path.join(font_dir, os.path.basename(f))
-                        os.rename(f, new_name)
-                        if os.path.splitext(new_name)[1][1:] in FONT_EXTENSIONS:
-                            files.append(new_name)
-                    except Exception as e:
-                        logger.error(f"Error when moving {f}: {e}")
-            try:
-                # print(files)
-                return files[0]
-            except IndexError:
-                logger.error(f"Error: files={files}")
-                return default
-        else:
-            logger.error(f"Error {p.returncode} in running {script}")
+        files = find_downloaded_font(font_name, curdir) if index is not None else []
+        if len(files) == 0:
+            files = download_font(font_name, curdir)
+        font_files = [f for f in files if os.path.splitext(f)[1][1:] in FONT_EXTENSIONS]
+        if len(font_files) == 0:
+            logger.error(f"Error: files={files}")
+            if index is not None:
+                index.add_failure(font_name)
             return default
+        if index is not None:
+            index.add(font_name, font_files[0], files)
+        return font_files[0]
     except Exception as e:
         logger.error(f"Exception: {e}")
+        if index is not None:
+            index.add_failure(font_name)
         return default
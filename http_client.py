@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""Shared HTTP client with connection pooling, timeouts and retries."""
+# External libraries
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import make_headers
+from urllib3.util.retry import Retry
+
+
+default_ua = ("Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko)"
+              " Chrome/107.0.0.0 Safari/537.36")
+# Content types of pages that can be parsed
+TEXT_CONTENT_TYPES = ["text/html", "text/xml", "text/plain", "application/xml"]
+# Magic bytes of binary files that are sometimes served as text/html
+BINARY_SIGNATURES = [b"%PDF", b"PK\x03\x04", b"\x89PNG", b"\xff\xd8\xff", b"GIF8"]
+
+
+class ContentError(Exception):
+    """Raised when the response body is too large or is not HTML/XML."""
+
+
+def is_text_content_type(content_type):
+    """Check if the Content-Type header is HTML/XML (or missing)."""
+    if not content_type:
+        return True
+    mime = content_type.split(";")[0].strip().lower()
+    return mime in TEXT_CONTENT_TYPES or mime.endswith("+xml")
+
+
+class HttpClient(object):
+    """
+    HTTP client used for RSS feeds, article pages and the URL shortener.
+
+    Keeps a keep-alive connection pool per host, sets connect/read timeouts,
+    retries idempotent requests with exponential backoff and accepts
+    compressed responses (brotli is used if the `brotli` package is installed).
+
+    Arguments
+    ---------
+    timeout: tuple, optional
+        Connect and read timeouts (in seconds)
+    retries: int, optional
+        Number of retries of failed GET/HEAD requests
+    backoff_factor: float, optional
+        Backoff factor of the retries (sleep for factor * 2**(n_retry - 1) s)
+    pool_maxsize: int, optional
+        Maximum number of connections kept alive per host
+    rate_limiter: rate_limiter.HostRateLimiter, optional
+        If given, requests wait for the rate limit of the host
+    user_agent: str, optional
+        User-Agent header
+    """
+
+    def __init__(
+        self,
+        timeout=(10, 30),
+        retries=3,
+        backoff_factor=1,
+        pool_maxsize=10,
+        rate_limiter=None,
+        user_agent=default_ua,
+    ):
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter
+
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=["HEAD", "GET", "OPTIONS"],
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_maxsize=pool_maxsize, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update(
+            {
+                "User-Agent": user_agent,
+                "Accept-Encoding": make_headers(accept_encoding=True)["accept-encoding"],
+            }
+        )
+
+    def request(self, method, url, rate_limited=True, **kwargs):
+        """
+        Send an HTTP request.
+
+        Arguments
+        ---------
+        method: str
+            HTTP method
+        url: str
+            URL
+        rate_limited: bool, optional
+            If False, the request does not wait for the host rate limit
+        kwargs: dict, optional
+            Passed to `requests.Session.request`
+
+        Returns
+        -------
+        requests.Response
+        """
+        if rate_limited and self.rate_limiter is not None:
+            self.rate_limiter.acquire(url)
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.request(method, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        """Send a GET request."""
+        return self.request("GET", url, **kwargs)
+
+    def download(self, url, max_size=None, chunk_size=65536, **kwargs):
+        """
+        Stream the body of a GET request, aborting early if it cannot be parsed.
+
+        The download is aborted if the Content-Type is not HTML/XML, if the first
+        bytes look like a binary file (e.g. PDF) or if the body exceeds `max_size`.
+        The body is not downloaded for responses other than 200.
+
+        Arguments
+        ---------
+        url: str
+            URL
+        max_size: int, optional
+            Maximum size (in bytes) of the body
+        chunk_size: int, optional
+            Size (in bytes) of the chunks the body is read in
+        kwargs: dict, optional
+            Passed to `get`
+
+        Returns
+        -------
+        response: requests.Response
+            Response; its `content` is the downloaded body.
+
+        Raises
+        ------
+        ContentError
+            If the response is too large or is not HTML/XML.
+        """
+        req = self.get(url, stream=True, **kwargs)
+        try:
+            if req.status_code != 200:
+                req._content = b""
+                return req
+            if not is_text_content_type(req.headers.get("Content-Type")):
+                raise ContentError(f"Content-Type {req.headers['Content-Type']} is not HTML/XML")
+            length = req.headers.get("Content-Length")
+            if max_size is not None and length is not None and length.isdigit():
+                if int(length) > max_size:
+                    raise ContentError(f"Content-Length {length} exceeds {max_size} bytes")
+            body = bytearray()
+            for chunk in req.iter_content(chunk_size=chunk_size):
+                if len(body) == 0 and chunk.startswith(tuple(BINARY_SIGNATURES)):
+                    raise ContentError("Body is a binary file")
+                body += chunk
+                if max_size is not None and len(body) > max_size:
+                    raise ContentError(f"Body exceeds {max_size} bytes")
+            req._content = bytes(body)
+            return req
+        finally:
+            req.close()
+
+    def post(self, url, **kwargs):
+        """Send a POST request (not retried)."""
+        return self.request("POST", url, **kwargs)
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""On-disk cache of article page sources."""
+# Standard library
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+class PageCache(object):
+    """
+    Cache of page sources, stored as gzip files named by the hash of the URL.
+
+    Each page has a JSON file with its URL and HTTP validators (ETag and
+    Last-Modified) next to it, so that stale pages can be revalidated
+    with conditional requests. The least recently used pages are evicted
+    when the total size exceeds `max_size`.
+
+    Arguments
+    ---------
+    cache_dir: str
+        Directory with the cached pages
+    max_size: float, optional
+        Maximum total size (in MB) of the cache
+    max_age: float, optional
+        Time (in hours) during which a page is used without revalidation
+    offline: bool, optional
+        If True, cached pages are always used, regardless of their age
+    """
+
+    def __init__(self, cache_dir, max_size=500, max_age=24, offline=False):
+        self.cache_dir = cache_dir
+        self.max_size = max_size * 1024**2
+        self.max_age = max_age * 3600
+        self.offline = offline
+        self.lock = threading.Lock()
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        self.total_size = sum(os.path.getsize(f) for f, _ in self.list_files())
+
+    def get_path(self, url):
+        """Path to the cached page (without extension)."""
+        digest = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, digest[:2], digest)
+
+    def list_files(self):
+        """List (page file, metadata file) pairs in the cache."""
+        for root, _, files in os.walk(self.cache_dir):
+            for fname in files:
+                if fname.endswith(".gz"):
+                    page_file = os.path.join(root, fname)
+                    yield page_file, page_file[: -len(".gz")] + ".json"
+
+    def get(self, url):
+        """
+        Get a cached page.
+
+        Returns
+        -------
+        content: bytes or None
+            Page source or None if the page is not cached
+        meta: dict or None
+            Metadata with "url", "etag", "modified" and "stored" (UNIX time) keys
+        """
+        path = self.get_path(url)
+        try:
+            with open(path + ".json") as f:
+                meta = json.load(f)
+            with gzip.open(path + ".gz", "rb") as f:
+                content = f.read()
+        except (OSError, ValueError):
+            return None, None
+        try:
+            # Update the access time for LRU eviction
+            os.utime(path + ".gz")
+        except OSError:
+            # Evicted by another thread after reading; the content is still valid
+            pass
+        return content, meta
+
+    def is_fresh(self, meta):
+        """Check if a cached page can be used without revalidation."""
+        return self.offline or time.time() - meta["stored"] < self.max_age
+
+    def touch(self, url):
+        """Mark a cached page as revalidated."""
+        path = self.get_path(url)
+        try:
+            with open(path + ".json") as f:
+                meta = json.load(f)
+            meta["stored"] = time.time()
+            self.write_json(path + ".json", meta)
+        except (OSError, ValueError):
+            pass
+
+    @staticmethod
+    def write_json(fname, meta):
+        tmp = f"{fname}.{threading.get_ident()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, fname)
+
+    def put(self, url, content, etag=None, modified=None):
+        """Store a page and evict the least recently used pages if needed."""
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+        path = self.get_path(url)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        old_size = os.path.getsize(path + ".gz") if os.path.isfile(path + ".gz") else 0
+        tmp = f"{path}.gz.{threading.get_ident()}.tmp"
+        with gzip.open(tmp, "wb") as f:
+            f.write(content)
+        os.replace(tmp, path + ".gz")
+        meta = dict(url=url, etag=etag, modified=modified, stored=time.time())
+        self.write_json(path + ".json", meta)
+        with self.lock:
+            self.total_size += os.path.getsize(path + ".gz") - old_size
+            if self.total_size > self.max_size:
+                self.evict()
+
+    def evict(self):
+        """Remove the least recently used pages until the cache fits `max_size`."""
+        files = sorted(self.list_files(), key=lambda i: os.path.getmtime(i[0]))
+        for page_file, meta_file in files:
+            if self.total_size <= self.max_size:
+                break
+            size = os.path.getsize(page_file)
+            for fname in [page_file, meta_file]:
+                try:
+                    os.remove(fname)
+                except OSError:
+                    pass
+            self.total_size -= size
+
+    def iter_pages(self):
+        """Iterate over (url, content) of all cached pages, e.g. to re-run the parser offline."""
+        for page_file, meta_file in self.list_files():
+            try:
+                with open(meta_file) as f:
+                    url = json.load(f)["url"]
+                with gzip.open(page_file, "rb") as f:
+                    yield url, f.read()
+            except (OSError, ValueError, KeyError):
+                continue
@@ -2,28 +2,56 @@
 """Retrieve journal article's HTML/XML and extract the text."""
 # Standard library
 import os
-import urllib
+import time
 
 # External libraries
 import bs4
-# from fake_useragent import UserAgent
-# from fake_useragent.errors import FakeUserAgentError
 import requests
 
 # Local modules
+from browser_pool import BrowserPool
+from extraction_rules import RuleRegistry
+from fetch_router import BLOCKED_STATUS_CODES, FETCH_TIERS, HTTP
+from http_client import ContentError, HttpClient
 from logger import logger
 
 
-default_ua = ("Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko)"
-              " Chrome/107.0.0.0 Safari/537.36")
+_default_rules = None
 
 
-def get_page_source(url, exec_dir):
+class FetchError(Exception):
+    """
+    Raised when the page source cannot be retrieved.
+
+    `blocked` is True if the host refused the request (e.g. 403 or a refused
+    connection), as opposed to errors of this page, such as 404.
+    """
+
+    def __init__(self, msg, status_code=None, blocked=False):
+        super().__init__(msg)
+        self.status_code = status_code
+        self.blocked = blocked
+
+
+class UnsupportedContentError(FetchError):
+    """Raised when the page is too large or is not HTML/XML."""
+
+
+class NotOpenAccessError(Exception):
+    """Raised when the page does not contain open access marks."""
+
+
+def get_page_source(
+    url, exec_dir, client=None, browser_pool=None, router=None, cache=None, max_size=None
+):
     """
     Send an HTTP request to get the HTML/XML page.
 
     Uses requests first, but if the status code is not 200,
     tries to use run a headless browser session using selenium.
+    If a router is given, the tiers that have not been working for the host
+    are skipped. If a cache is given, fresh cached pages are returned without
+    network requests and stale ones are revalidated with a conditional request.
 
 
     Arguments
@@ -32,48 +60,206 @@ def get_page_source(url, exec_dir):
         URL pointing to the page
     exec_dir: str
         Directory with firefox & geckodriver
+    client: http_client.HttpClient, optional
+        Shared HTTP client; its rate limiter is also used by selenium.
+        If not given, a new client is created.
+    browser_pool: browser_pool.BrowserPool, optional
+        Pool of headless browsers. If not given, a browser is started
+        for this page only.
+    router: fetch_router.FetchRouter, optional
+        Per-host statistics of the fetch tiers
+    cache: page_cache.PageCache, optional
+        On-disk cache of page sources
+    max_size: int, optional
+        Maximum size (in bytes) of the page; larger pages are aborted early
 
     Returns
     -------
     content: str
         Page source.
+
+    Raises
+    ------
+    FetchError
+        If neither requests nor selenium could retrieve the page.
+    UnsupportedContentError
+        If the page is too large or is not HTML/XML.
+    """
+    if client is None:
+        client = HttpClient()
+    cached, meta = (None, None) if cache is None else cache.get(url)
+    headers = {}
+    if cached is not None:
+        if cache.is_fresh(meta):
+            return cached
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("modified"):
+            headers["If-Modified-Since"] = meta["modified"]
+    tiers = FETCH_TIERS if router is None else router.route(url)
+    status_code = None
+    for tier in tiers:
+        t0 = time.monotonic()
+        etag, modified = None, None
+        try:
+            if tier == HTTP:
+                req = page_source_from_requests(url, client, headers=headers, max_size=max_size)
+                if req.status_code == 304:
+                    logger.info(f"Using cached page of {url}")
+                    cache.touch(url)
+                    return cached
+                content = req.content
+                etag, modified = req.headers.get("ETag"), req.headers.get("Last-Modified")
+            else:
+                content = page_source_from_browser(
+                    url, exec_dir, client, browser_pool, max_size=max_size
+                )
+        except UnsupportedContentError:
+            # The page was retrieved, so the tier is working
+            if router is not None:
+                router.record(url, tier, True, time.monotonic() - t0)
+            raise
+        except FetchError as e:
+            if router is not None and (e.blocked or tier != HTTP):
+                router.record(url, tier, False, time.monotonic() - t0)
+            if e.status_code is None and tier == HTTP:
+                # Connection errors would happen in the browser too
+                raise
+            status_code = e.status_code or status_code
+            error = e
+            continue
+        if router is not None:
+            router.record(url, tier, True, time.monotonic() - t0)
+        if cache is not None and content:
+            cache.put(url, content, etag=etag, modified=modified)
+        return content
+    raise FetchError(str(error), status_code=status_code)
+
+
+def is_connection_refused(error):
+    """Check if a requests exception was caused by a refused or reset connection."""
+    seen = set()
+    errors = [error]
+    while errors:
+        e = errors.pop()
+        if e is None or id(e) in seen:
+            continue
+        seen.add(id(e))
+        if isinstance(e, (ConnectionRefusedError, ConnectionResetError)):
+            return True
+        # requests and urllib3 wrap the original error in `args` or `reason`
+        errors.extend(i for i in getattr(e, "args", ()) if isinstance(i, BaseException))
+        errors.extend([getattr(e, "reason", None), e.__cause__, e.__context__])
+    return False
+
+
+def page_source_from_requests(url, client, headers=None, max_size=None):
+    """
+    Send a GET request using requests, streaming the body.
+
+    Returns the response if the status code is 200 or 304
+    (if `headers` make the request conditional), otherwise raises FetchError.
+    Raises UnsupportedContentError if the body is too large or is not HTML/XML.
     """
-    # try:
-    #     ua = UserAgent()
-    #     headers = {"User-Agent": ua.data_browsers["chrome"][2]}
-    # except FakeUserAgentError:
-    #     headers = {"User-Agent": default_ua}
-    headers = {"User-Agent": default_ua}
     try:
-        req = requests.get(url, headers=headers)
+        req = client.download(url, max_size=max_size, headers=headers)
+    except ContentError as e:
+        logger.info(f"{e} when processing {url}")
+        raise UnsupportedContentError(str(e))
     except requests.exceptions.RequestException as e:
         logger.info(f"Requests exception {e} when processing {url}")
-        return ""
+        raise FetchError(f"Requests exception {e}", blocked=is_connection_refused(e))
+    if req.status_code not in [200, 304]:
+        raise FetchError(
+            f"Status code {req.status_code}",
+            status_code=req.status_code,
+            blocked=req.status_code in BLOCKED_STATUS_CODES,
+        )
+    return req
+
 
-    if req.status_code == 200:
-        content = req.content
+def page_source_from_browser(url, exec_dir, client, browser_pool=None, max_size=None):
+    """Get the page source using a headless browser; raise FetchError on failure."""
+    logger.info("Using Selenium")
+    if browser_pool is None:
+        pool = BrowserPool(exec_dir, size=1)
     else:
-        try:
-            # Try Selenium instead
-            logger.info("Using Selenium")
-            from selenium import webdriver  # noqa
-            from selenium.webdriver.firefox.options import Options  # noqa
-            from selenium.webdriver.firefox.service import Service  # noqa
-
-            options = Options()
-            options.add_argument("--headless")
-            service = Service(os.path.join(exec_dir, "geckodriver"))
-
-            dr = webdriver.Firefox(options=options, service=service)
-            dr.get(url)
-            content = dr.page_source
-            dr.quit()
-        except Exception as e:
-            logger.info(f"Selenium exception {e} when processing {url}")
-            content = ""
+        pool = browser_pool
+    before_request = None
+    if client.rate_limiter is not None:
+        before_request = client.rate_limiter.acquire
+    try:
+        content = pool.get_page_source(url, before_request=before_request)
+    except Exception as e:
+        logger.info(f"Selenium exception {e} when processing {url}")
+        raise FetchError(f"Selenium exception {e}")
+    finally:
+        if browser_pool is None:
+            pool.close()
+    if max_size is not None and len(content) > max_size:
+        raise UnsupportedContentError(f"Page source exceeds {max_size} bytes")
     return content
 
 
+def parse_soup(content, parser, find_args, fast=True):
+    """
+    Parse the page and find all elements matching `find_args`.
+
+    If `fast` is True, only the matching elements and their descendants are parsed
+    using `bs4.SoupStrainer`, which is much faster than building the tree of
+    the whole page. Falls back to parsing the whole page if `find_args` cannot be
+    expressed as a strainer or if nothing is found.
+
+    Returns
+    -------
+    result: bs4.element.ResultSet
+        Elements matching `find_args`
+    """
+    if fast and set(find_args) <= {"name", "attrs"} and not parser.startswith("html5lib"):
+        strainer = bs4.SoupStrainer(**find_args)
+        soup = bs4.BeautifulSoup(content, parser, parse_only=strainer)
+        result = soup.find_all(**find_args)
+        if len(result) > 0:
+            return result
+    soup = bs4.BeautifulSoup(content, parser)
+    return soup.find_all(**find_args)
+
+
+def find_containing(tags, find_args):
+    """
+    Find tags that have at least one descendant matching `find_args`.
+
+    Equivalent to checking `len(tag.find_all(**find_args)) != 0` for each tag,
+    but the document is traversed only once even if the tags are nested.
+
+    Arguments
+    ---------
+    tags: list
+        List of bs4 tags
+    find_args: dict
+        Dictionary specifying tag names and attributes
+
+    Returns
+    -------
+    found: set
+        Set of `id()` of the tags containing matching elements
+    """
+    ids = set(id(tag) for tag in tags)
+    # Only search from the tags that are not inside other tags in the list
+    roots = [tag for tag in tags if not any(id(p) in ids for p in tag.parents)]
+    ancestors = set()
+    for root in roots:
+        for match in root.find_all(**find_args):
+            for parent in match.parents:
+                if id(parent) in ancestors:
+                    # the rest of the ancestors has been marked already
+                    break
+                ancestors.add(id(parent))
+                if parent is root:
+                    break
+    return ids & ancestors
+
+
 def text_from_soup(
     content,
     parser,
@@ -81,6 +267,7 @@ def text_from_soup(
     check_for_open_access=None,
     between_children=None,
     escape_result=None,
+    fast=True,
 ):
     """
     Extract text from html or xml page using beautifulsoup
@@ -102,22 +289,30 @@ def text_from_soup(
         which the main text is
     escape_result: dict, optional
         Omit these elements
+    fast: bool, optional
+        If True, only the elements matching `find_args` are parsed
+        (see `parse_soup`)
 
     Returns
     -------
     text: str
         Extracted text joined by whitespace
+
+    Raises
+    ------
+    NotOpenAccessError
+        If `check_for_open_access` is given and no matching elements are found.
     """
-    soup = bs4.BeautifulSoup(content, parser)
     if check_for_open_access is not None:
+        soup = bs4.BeautifulSoup(content, parser)
         oa_check = soup.find_all(**check_for_open_access)
         # if len(oa_check) == 0:
         if len(oa_check) > 0:
             result = soup.find_all(**find_args)
         else:
-            return ""
+            raise NotOpenAccessError("No open access marks found")
     else:
-        result = soup.find_all(**find_args)
+        result = parse_soup(content, parser, find_args, fast=fast)
 
     if escape_result is not None:
         if isinstance(escape_result, dict):
@@ -129,69 +324,70 @@ def text_from_soup(
                 # a new list, escaping tags specified by
                 # escape_result dictionary
                 _res = result[0]
-                result = []
-                for tag in _res:
-                    if isinstance(tag, bs4.element.Tag):
-                        if not (
-                            esc["name"] == tag.name
-                            and esc["attrs"]["class"] == tag.attrs["class"]
-                        ):
-                            result.append(tag)
+                escaped = set(id(tag) for tag in _res.find_all(recursive=False, **esc))
+                result = [
+                    tag
+                    for tag in _res
+                    if isinstance(tag, bs4.element.Tag) and id(tag) not in escaped
+                ]
             else:
-                # Loop over tags in the list `result` and remove
-                # tags specified by escape_result dictionary
-                to_remove = []
-                for tag in result:
-                    found = tag.find_all(**esc)
-                    if len(found) != 0:
-                        to_remove.append(tag)
-                [result.remove(i) for i in to_remove]
+                # Remove tags containing elements specified by
+                # escape_result dictionary
+                to_remove = find_containing(result, esc)
+                result = [tag for tag in result if id(tag) not in to_remove]
 
     if between_children is None:
         return " ".join([i.text for i in result])
     else:
         assert len(between_children) == 2
-        try:
-            if len(result) == 0:
-                _children = between_children.copy()
-                for i, child_descr in enumerate(between_children):
-                    if isinstance(child_descr, dict):
-                        child_tag = result[0].find_all(**child_descr)[0]
-                        _children[i] = result[0].contents.index(child_tag)
-                children_subset = slice(*_children)
-                text = ""
-                for child in result[0].contents[children_subset]:
-                    try:
-                        text += child.text
-                    except AttributeError:
-                        text += child.strip()
-                    except Exception:
-                        pass
-            else:
+        if len(result) == 0:
+            return ""
+        # Keep the tags starting from the one that contains or matches
+        # the first description and until the one that contains or matches
+        # the second description
+        starts = find_containing(result, between_children[0])
+        ends = find_containing(result, between_children[1])
+        to_keep = False
+        _res = []
+        for tag in result:
+            if (id(tag) in starts) or (
+                between_children[0].get("attrs", {}).items() <= tag.attrs.items()
+            ):
+                to_keep = True
+            if (id(tag) in ends) or (
+                between_children[1].get("attrs", {}).items() <= tag.attrs.items()
+            ):
                 to_keep = False
-                _res = []
-                for tag in result:
-                    found = tag.find_all(**between_children[0])
-                    if (len(found) != 0) or (
-                        between_children[0].get("attrs", {}).items()
-                        <= tag.attrs.items()
-                    ):
-                        to_keep = True
-                    found = tag.find_all(**between_children[1])
-                    if (len(found) != 0) or (
-                        between_children[1].get("attrs", {}).items()
-                        <= tag.attrs.items()
-                    ):
-                        to_keep = False
-                    if to_keep:
-                        _res.append(tag)
-                text = " ".join([i.text for i in _res])
-        except IndexError:
-            text = ""
-        return text
-
-
-def extract_text(url, exec_dir, journal, url_ready=False):
+            if to_keep:
+                _res.append(tag)
+        return " ".join([i.text for i in _res])
+
+
+def get_default_rules():
+    """Get the registry of extraction rules from the files next to this module."""
+    global _default_rules
+    if _default_rules is None:
+        curdir = os.path.dirname(os.path.realpath(__file__))
+        _default_rules = RuleRegistry(
+            os.path.join(curdir, "extraction_rules.json"),
+            os.path.join(curdir, "journal_list.json"),
+        )
+    return _default_rules
+
+
+def extract_text(
+    url,
+    exec_dir,
+    journal,
+    url_ready=False,
+    client=None,
+    browser_pool=None,
+    router=None,
+    cache=None,
+    rules=None,
+    max_size=None,
+    raise_errors=False,
+):
     """
     Download XML/HTML doc and parse it.
 
@@ -202,166 +398,57 @@ def extract_text(url, exec_dir, journal, url_ready=False):
     exec_dir: str
         Directory with firefox & geckodriver
     journal: str
-        Journal short name (see `journal_list.json` for available journals).
+        Journal short name (see `journal_list.json` for available journals
+        and `extraction_rules.json` for their rules).
     url_ready: bool
         If False, the `url` is modified according to journal rules.
+    client: http_client.HttpClient, optional
+        Shared HTTP client
+    browser_pool: browser_pool.BrowserPool, optional
+        Pool of headless browsers used if requests fail
+    router: fetch_router.FetchRouter, optional
+        Per-host statistics used to choose between requests and selenium
+    cache: page_cache.PageCache, optional
+        On-disk cache of page sources, keyed by the document URL
+    rules: extraction_rules.RuleRegistry, optional
+        Extraction rules of the journals. By default, the rules are read from
+        `extraction_rules.json` and `journal_list.json` next to this module.
+    max_size: int, optional
+        Maximum size (in bytes) of the page
+    raise_errors: bool, optional
+        If True, re-raise `FetchError` and `NotOpenAccessError`
+        instead of returning an empty string.
 
     Returns
     -------
     text: str
         Extracted text.
     """
-    parsed_link = urllib.parse.urlparse(url)
-
-    between_children = None
-    escape_result = None
-    check_for_open_access = None
-
-    if journal.upper() in ["ACP", "AMT", "GMD", "WCD"]:
-        # EGU journals
-        if url_ready:
-            doc_url = parsed_link.geturl()
-        else:
-            netloc = "http://{}.copernicus.org/articles".format(journal.lower())
-            path_split = [s for s in parsed_link.path.split("/") if s]
-            _sub_path = "/".join(path_split[1].split("-")[1:])
-            doc_url = "{}/{}/{}.xml".format(netloc, _sub_path, path_split[1])
-        find_args = dict(name="body")
-        parser = "lxml-xml"
-
-    elif journal.upper() in ["BLM", "AAS", "MAP", "JAC", "TAC", "CC", "APJAS"]:
-        # Springer journals
-        doc_url = parsed_link.geturl()
-        # new_path = "article{}/fulltext.html".format(parsed_link.path)
-        # if url_ready:
-        #     doc_url = parsed_link.geturl()
-        # else:
-        #     doc_url = parsed_link._replace(path=new_path).geturl()
-        parser = "lxml-html"
-        # find_args = dict(attrs={"class": "Para"})
-        # find_args = dict(
-        #     name="div", attrs={"class": "c-article-section__content"}
-        # )
-        find_args = dict(name="section")
-        between_children = [
-            dict(name="section", attrs={"data-title": "Abstract"}),
-            dict(name="section", attrs={"data-title": "References"}),
-        ]
-
-    elif journal.upper() in ["ASL", "JAMES", "JGRA", "QJRMS", "GRL", "METAPPS"]:
-        # Wiley journals
-        new_path = parsed_link.path.replace("/abs", "/full")
-        if url_ready:
-            doc_url = parsed_link.geturl()
-        else:
-            doc_url = parsed_link._replace(path=new_path, query="").geturl()
-        parser = "lxml-html"
-        # find_args = dict(attrs={'class': 'para'})
-        # This is probably better (although excludes abstract):
-        # find_args = dict(name='section',
-        #                 attrs={'class':
-        #                        'article-section article-body-section'})
-        # Wiley's website seems to have changed HTML tags, so now the text is
-        # within div or section tags of class "article-section__content"
-        find_args = dict(
-            name=["div", "section"], attrs={"class": "article-section__content"}
-        )
-        if journal.upper() in ["JGRA", "QJRMS", "GRL"]:
-            # # parse only the articles that are open-access
-            # # under the Creative Commons license
-            # _class_attr = "article-type article-type--cc"
-            # check_for_open_access = dict(name='a',
-            #                              attrs={'class': _class_attr})
-            # New: check for non-open-access,
-            # because older open-access papers do not have CC license
-            # Check if there is a button to get access
-            # NOTE: text_from_soup() is changed accordingly
-            # _class_attr = dict(title='Log in to get access')
-            # check_for_open_access = dict(name='a',
-            #                              attrs=_class_attr)
-            #
-            # 2018-11-28: Changed again to check for a OA badge,
-            # because closed-access accepted issues go through
-            check_for_open_access = dict(
-                name="div",
-                text=lambda x: x in ["Open Access", "Free Access", "Full Access"],
-                attrs={"class": "doi-access"},
-            )
-
-    elif journal.upper() in ["TA", "TB"]:
-        # Tellus A/B
-        # Now one of Taylor&Francis journals
-        doc_url = parsed_link.geturl()
-        parser = "lxml-html"
-        # find_args = dict(name='div', attrs={'id': 'articleHTML'})
-        # between_children = [None, dict(name='h1', text='References')]
-        find_args = dict(
-            name="p",
-            attrs={
-                "xmlns:mml": "http://www.w3.org/1998/Math/MathML",
-                "xmlns:xsi": "http://www.w3.org/2001/XMLSchema-instance",
-                "xmlns:oasis": "http://docs.oasis-open.org/ns/oasis-exchange/table",  # NOQA
-            },
-        )
-        escape_result = dict(name="span", attrs={"class": "ref-overlay scrollable-ref"})
-
-    elif journal.upper() in ["AM", "IJAS", "JCLI"]:
-        # Hindawi journals (by HTML)
-        doc_url = parsed_link.geturl()
-        parser = "lxml-html"
-        find_args = dict(name="div", attrs={"class": "xml-content"})
-        escape_result = dict(name="h4", text="References")
-
-    elif journal.upper() in ["BAMS", "EINT"]:
-        # American Meteorological Society journals
-        doc_url = parsed_link.geturl()
-        parser = "lxml-html"
-        find_args = {"name": "div", "attrs": {"id": "articleBody"}}
-        between_children = [
-            {},
-            {"name": "section", "attrs": {"class": ["refSection", "level1"]}},
-        ]
-        escape_result = [
-            {"name": "a"},
-            {"name": "ack"},
-        ]
-
-    elif journal.upper() == "ATMOS":
-        # MDPI Atmosphere
-        if parsed_link.geturl().endswith("/htm"):
-            doc_url = parsed_link.geturl()
-        else:
-            doc_url = parsed_link.geturl() + "/htm"
-        parser = "lxml-html"
-        find_args = dict(name="div", attrs={"class": "html-body"})
-
-    elif journal.upper() == "FRONT":
-        # Frontiers in Earth Science | Atmospheric Science section
-        if parsed_link.geturl().endswith("/full"):
-            doc_url = parsed_link.geturl()
-        else:
-            doc_url = parsed_link.geturl() + "/full"
-        parser = "lxml-html"
-        find_args = dict(name="div", attrs={"class": "JournalFullText"})
-        escape_result = dict(name="div", attrs={"class": ["References"]})
-
-    elif journal.upper() == "NPJCLIMATSCI":
-        doc_url = parsed_link.geturl()
-        parser = "lxml-html"
-        find_args = dict(name="section")
-        escape_result = dict(name="div", attrs={"class": "c-article-equation"})
-        between_children = [
-            dict(name="section", attrs={"data-title": "Abstract"}),
-            dict(name="section", attrs={"data-title": "References"}),
-        ]
-
+    if rules is None:
+        rules = get_default_rules()
+    rule = rules.get(journal)
+    if rule is not None:
+        doc_url = rule.get_doc_url(url, journal, url_ready=url_ready)
+        parser = rule.parser
+        find_args = rule.find_args
+        check_for_open_access = rule.check_for_open_access
+        between_children = rule.between_children
+        escape_result = rule.escape_result
     else:
         logger.info("Skip {0} journal: no rule for it".format(journal))
         doc_url = None
 
     if doc_url is not None:
         try:
-            doc = get_page_source(url, exec_dir)
+            doc = get_page_source(
+                doc_url,
+                exec_dir,
+                client=client,
+                browser_pool=browser_pool,
+                router=router,
+                cache=cache,
+                max_size=max_size,
+            )
             if not doc:
                 return ""
             text = text_from_soup(
@@ -372,6 +459,11 @@ def extract_text(url, exec_dir, journal, url_ready=False):
                 between_children=between_children,
                 escape_result=escape_result,
             )
+        except (FetchError, NotOpenAccessError) as e:
+            logger.info(f"{e} when processing {doc_url}")
+            if raise_errors:
+                raise
+            return ""
         except Exception as e:
             err_msg = f"Exception {e} when processing {doc_url} with the following arguments:"
             err_msg += f"\n{parser=}"
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""Process items in stages running concurrently, joined by bounded queues."""
+# Standard library
+import queue
+import threading
+
+# Local modules
+from logger import logger
+
+
+# Marks the end of the input of a stage
+_DONE = object()
+
+
+class Stage(object):
+    """
+    Step of a pipeline.
+
+    Arguments
+    ---------
+    name: str
+        Name used in logs
+    func: callable
+        Function called with an item; its return value is passed to the next stage
+    workers: int, optional
+        Number of threads running `func`
+    """
+
+    def __init__(self, name, func, workers=1):
+        self.name = name
+        self.func = func
+        self.workers = max(1, workers)
+
+
+class Pipeline(object):
+    """
+    Run stages in threads; the results of the last stage are yielded to the caller.
+
+    The queues between the stages hold at most `queue_size` items, so a slow
+    stage blocks the stages before it and the number of items in memory stays
+    bounded. The order of the items is not preserved.
+
+    Arguments
+    ---------
+    stages: list
+        List of Stage instances
+    queue_size: int, optional
+        Maximum number of items waiting for each stage
+    """
+
+    def __init__(self, stages, queue_size=4):
+        self.stages = stages
+        self.queue_size = queue_size
+        self.stopped = threading.Event()
+        self.lock = threading.Lock()
+        # Number of items dropped because of exceptions in the last run
+        self.errors = 0
+
+    def put(self, q, item):
+        """Put an item into a queue unless the pipeline is stopped."""
+        while not self.stopped.is_set():
+            try:
+                q.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def run(self, items):
+        """
+        Pass items through all stages.
+
+        Arguments
+        ---------
+        items: iterable
+            Input of the first stage
+
+        Yields
+        ------
+        Items returned by the last stage, in the calling thread.
+        Items for which a stage raised an exception are logged and dropped.
+        """
+        self.stopped.clear()
+        self.errors = 0
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(self.stages) + 1)]
+        threads = []
+
+        def feed():
+            try:
+                for item in items:
+                    if not self.put(queues[0], item):
+                        return
+            except Exception:
+                logger.exception("Pipeline input failed")
+            for _ in range(self.stages[0].workers):
+                self.put(queues[0], _DONE)
+
+        def work(i, stage, finished):
+            q_in, q_out = queues[i], queues[i + 1]
+            while not self.stopped.is_set():
+                try:
+                    item = q_in.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                if item is _DONE:
+                    break
+                try:
+                    result = stage.func(item)
+                except Exception:
+                    logger.exception(f"Error in pipeline stage {stage.name}")
+                    with self.lock:
+                        self.errors += 1
+                    continue
+                self.put(q_out, result)
+            with finished["lock"]:
+                finished["count"] += 1
+                last = finished["count"] == stage.workers
+            if last:
+                n_next = self.stages[i + 1].workers if i + 1 < len(self.stages) else 1
+                for _ in range(n_next):
+                    self.put(q_out, _DONE)
+
+        threads.append(threading.Thread(target=feed, name="pipeline-input", daemon=True))
+        for i, stage in enumerate(self.stages):
+            finished = dict(count=0, lock=threading.Lock())
+            for n in range(stage.workers):
+                threads.append(
+                    threading.Thread(
+                        target=work,
+                        args=(i, stage, finished),
+                        name=f"pipeline-{stage.name}-{n}",
+                        daemon=True,
+                    )
+                )
+        for t in threads:
+            t.start()
+
+        try:
+            while True:
+                item = queues[-1].get()
+                if item is _DONE:
+                    break
+                yield item
+        finally:
+            # Also stops the threads if the caller did not consume all items
+            self.stopped.set()
+            for t in threads:
+                t.join()
@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+"""Durable queue of tweets waiting to be posted."""
+# Standard library
+import os
+import random
+import threading
+import time
+
+# External packages
+import requests
+from tinydb import TinyDB
+import tweepy
+
+# Local modules
+from logger import logger
+
+
+def is_retryable(error):
+    """Check if posting may succeed later (rate limits, server and network errors)."""
+    if isinstance(error, tweepy.errors.HTTPException):
+        status_code = getattr(error.response, "status_code", None)
+        return status_code is None or status_code == 429 or status_code >= 500
+    if isinstance(error, (requests.exceptions.RequestException, tweepy.errors.TweepyException)):
+        # Network errors (RequestException is a subclass of OSError)
+        return True
+    # e.g. the image file is missing
+    return not isinstance(error, FileNotFoundError)
+
+
+class PostQueue(object):
+    """
+    Tweets waiting to be posted, stored in a TinyDB file.
+
+    Posts are sent in the order they were added. When the rate limit of the
+    API is exhausted, posting stops until the reset time given by the API
+    (the queue waits if it is less than `max_wait` seconds away, otherwise the
+    posts stay in the file for the next run). Failed posts are retried with
+    exponential backoff and jitter; they are dropped after `max_attempts`
+    or if the error cannot be fixed by retrying (e.g. 403).
+
+    Images given as bytes are kept in memory and uploaded from there. Only the
+    images of posts that are still pending after `process` are written to
+    `image_dir`, so that they can be posted in the next run.
+
+    Arguments
+    ---------
+    db_file: str
+        Path to the TinyDB file with pending posts
+    twitter_api: twitter_api.TwitterApi
+        Twitter API
+    max_attempts: int, optional
+        Number of attempts before a post is dropped
+    base_delay: float, optional
+        Delay (in seconds) after the first failed attempt
+    max_delay: float, optional
+        Maximum delay (in seconds) between attempts
+    max_wait: float, optional
+        Maximum time (in seconds) to wait for a rate limit reset or a retry
+    image_dir: str, optional
+        Directory with images of pending posts (defaults to `<db_file>_images`)
+    """
+
+    def __init__(
+        self,
+        db_file,
+        twitter_api,
+        max_attempts=5,
+        base_delay=60,
+        max_delay=3600,
+        max_wait=60,
+        image_dir=None,
+    ):
+        self.db = TinyDB(db_file)
+        self.image_dir = image_dir or os.path.splitext(db_file)[0] + "_images"
+        # Images of the posts added in this run, by post ID
+        self.images = {}
+        self.twitter_api = twitter_api
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_wait = max_wait
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.db)
+
+    def add(
+        self,
+        tweet_text,
+        short_url,
+        imgname=None,
+        in_reply_to_tweet_id=None,
+        entry=None,
+        image=None,
+    ):
+        """
+        Add a post to the queue.
+
+        Arguments
+        ---------
+        tweet_text: str
+            Text of the tweet (title of the article or reply)
+        short_url: str
+            Shortened URL of the article
+        imgname: str, optional
+            Path to the image; if `image` is given, the file name used for the upload
+        in_reply_to_tweet_id: str, optional
+            ID of the tweet to reply to
+        entry: dict, optional
+            Data passed back to the callbacks of `process`, e.g. URL and journal
+        image: bytes, optional
+            Encoded image
+
+        Returns
+        -------
+        int
+            ID of the post in the queue
+        """
+        post = dict(
+            tweet_text=tweet_text,
+            short_url=short_url,
+            imgname=imgname,
+            in_reply_to_tweet_id=in_reply_to_tweet_id,
+            entry=entry,
+            attempts=0,
+            not_before=0,
+            created=time.time(),
+            # True if the image is in `image_dir` and is deleted after posting
+            owns_image=False,
+        )
+        with self.lock:
+            post_id = self.db.insert(post)
+            if image is not None:
+                self.images[post_id] = image
+            return post_id
+
+    def remove(self, post):
+        """Remove a post and its stored image."""
+        with self.lock:
+            self.db.remove(doc_ids=[post.doc_id])
+            self.images.pop(post.doc_id, None)
+        if post.get("owns_image"):
+            try:
+                os.remove(post["imgname"])
+            except OSError:
+                pass
+
+    def save_images(self):
+        """Write images of pending posts from memory to `image_dir`."""
+        with self.lock:
+            for post_id, image in self.images.items():
+                post = self.db.get(doc_id=post_id)
+                if post is None:
+                    continue
+                os.makedirs(self.image_dir, exist_ok=True)
+                ext = os.path.splitext(post["imgname"] or "")[1] or ".png"
+                fname = os.path.join(self.image_dir, f"{int(post['created'])}_{post_id}{ext}")
+                with open(fname, "wb") as f:
+                    f.write(image)
+                self.db.update(dict(imgname=fname, owns_image=True), doc_ids=[post_id])
+            self.images = {}
+
+    def get_delay(self, attempts):
+        """Backoff delay (in seconds) after the given number of failed attempts."""
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+        return delay * random.uniform(0.5, 1.5)
+
+    def wait_until(self, tstamp, max_wait):
+        """Sleep until the UNIX time if it is close enough; return False otherwise."""
+        delay = tstamp - time.time()
+        if delay > max_wait:
+            return False
+        if delay > 0:
+            time.sleep(delay)
+        return True
+
+    def process(self, on_posted=None, on_failed=None, max_wait=None):
+        """
+        Send the pending posts whose time has come.
+
+        Arguments
+        ---------
+        on_posted: callable, optional
+            Called with the post (dict) and the tweet ID after a post is confirmed
+        on_failed: callable, optional
+            Called with the post and the exception when a post is dropped
+        max_wait: float, optional
+            Maximum time (in seconds) to wait for a rate limit reset or a retry;
+            `max_wait` of the queue by default, 0 to never sleep
+
+        Returns
+        -------
+        int
+            Number of posts sent
+        """
+        if max_wait is None:
+            max_wait = self.max_wait
+        n_posted = 0
+        with self.lock:
+            posts = sorted(self.db.all(), key=lambda i: i.doc_id)
+        for post in posts:
+            blocked_until = self.twitter_api.blocked_until()
+            if blocked_until and not self.wait_until(blocked_until, max_wait):
+                logger.info(
+                    f"Rate limit reached, {len(self)} posts wait until {time.ctime(blocked_until)}"
+                )
+                break
+            if not self.wait_until(post["not_before"], max_wait):
+                continue
+            try:
+                tweet_id = self.twitter_api.post_tweet(
+                    post["tweet_text"],
+                    post["short_url"],
+                    imgname=post["imgname"],
+                    in_reply_to_tweet_id=post["in_reply_to_tweet_id"],
+                    image=self.images.get(post.doc_id),
+                )
+            except Exception as e:
+                attempts = post["attempts"] + 1
+                if not is_retryable(e) or attempts >= self.max_attempts:
+                    logger.warning(f"Dropping post after {attempts} attempts: {e}")
+                    self.remove(post)
+                    if on_failed is not None:
+                        on_failed(dict(post), e)
+                    continue
+                not_before = time.time() + self.get_delay(attempts)
+                logger.info(f"Encountered {e}, retrying after {time.ctime(not_before)}")
+                with self.lock:
+                    self.db.update(
+                        dict(attempts=attempts, not_before=not_before), doc_ids=[post.doc_id]
+                    )
+                continue
+            self.remove(post)
+            n_posted += 1
+            if on_posted is not None:
+                on_posted(dict(post), tweet_id)
+        self.save_images()
+        return n_posted
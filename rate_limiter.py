@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""Per-host rate limiting of HTTP requests to publishers."""
+# Standard library
+import threading
+import time
+import urllib.parse
+
+
+class TokenBucket(object):
+    """
+    Token bucket rate limiter.
+
+    Tokens are refilled at `rate` per second up to `burst` tokens;
+    each request consumes one token and waits if none is left.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available and consume it."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.burst, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class HostRateLimiter(object):
+    """
+    Collection of token buckets, one per host.
+
+    Arguments
+    ---------
+    rate: float, optional
+        Default number of requests per second to the same host
+    burst: int, optional
+        Default number of requests that can be sent without waiting
+    host_limits: dict, optional
+        Mapping of host names to (rate, burst) tuples overriding the defaults
+    """
+
+    def __init__(self, rate=0.2, burst=1, host_limits=None):
+        self.rate = rate
+        self.burst = burst
+        self.host_limits = host_limits or {}
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def get_bucket(self, host):
+        """Get the token bucket of a host, creating it if necessary."""
+        with self.lock:
+            if host not in self.buckets:
+                rate, burst = self.host_limits.get(host, (self.rate, self.burst))
+                self.buckets[host] = TokenBucket(rate, burst)
+            return self.buckets[host]
+
+    def acquire(self, url):
+        """Wait until a request to the host of `url` is allowed."""
+        host = urllib.parse.urlparse(url).netloc.lower()
+        self.get_bucket(host).acquire()
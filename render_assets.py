@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""Stencils, fonts and word cloud renderers shared by all articles of a run."""
+# Standard library
+from glob import glob
+import os
+from random import choice
+import threading
+
+# External packages
+import numpy as np
+from PIL import Image
+from wordcloud import WordCloud
+
+
+# Quality/speed trade-offs of the word cloud layout:
+# * layout_scale: resolution of the layout relative to the output image
+#   (the image is upscaled by 1 / layout_scale)
+# * max_words: maximum number of words
+# * min_font_size: smallest font size (in layout pixels)
+# * font_step: step of font sizes tried when a word does not fit
+RENDER_PROFILES = {
+    "fast": dict(layout_scale=0.5, max_words=100, min_font_size=6, font_step=2),
+    "standard": dict(layout_scale=1, max_words=200, min_font_size=4, font_step=1),
+    "high": dict(layout_scale=1, max_words=300, min_font_size=3, font_step=1),
+}
+
+
+def load_stencil(path):
+    """
+    Read a stencil as a read-only 2D mask.
+
+    White pixels (255 in all RGB channels) are masked out, as in `WordCloud`,
+    so the mask does not have to be converted for every word cloud.
+    """
+    img = np.array(Image.open(path))
+    if img.ndim == 3:
+        img = np.where(img[:, :, :3].min(axis=-1) == 255, 255, 0).astype(np.uint8)
+    img.flags.writeable = False
+    return img
+
+
+class PreloadedFont(object):
+    """
+    Font file read into memory.
+
+    PIL's `ImageFont.truetype` reads file-like objects with `read()`, so passing
+    this object as `font_path` to `WordCloud` avoids opening the font file for
+    every font size tried during the layout.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.data = f.read()
+
+    def read(self, *args):
+        return self.data
+
+    def __repr__(self):
+        return f"PreloadedFont({self.path!r})"
+
+
+class RenderAssets(object):
+    """
+    Registry of decoded stencils, preloaded fonts and configured renderers.
+
+    Arguments
+    ---------
+    stencil_dir: str
+        Directory with stencil images
+    width: int
+        Width of word clouds
+    height: int
+        Height of word clouds
+    default_font: str, optional
+        Path to a font that is loaded immediately
+    pattern: str, optional
+        Glob pattern of the stencils chosen at random
+    """
+
+    def __init__(self, stencil_dir, width, height, default_font=None, pattern="cloud_*.png"):
+        self.width = width
+        self.height = height
+        self.lock = threading.Lock()
+        self.stencils = {
+            os.path.basename(path): load_stencil(path)
+            for path in sorted(glob(os.path.join(stencil_dir, pattern)))
+        }
+        if len(self.stencils) == 0:
+            raise ValueError(f"No stencils {pattern} in {stencil_dir}")
+        self.scaled_stencils = {}
+        self.fonts = {}
+        self.renderers = {}
+        if default_font is not None:
+            self.get_font(default_font)
+
+    def random_stencil(self):
+        """Name of a randomly chosen stencil."""
+        return choice(list(self.stencils))
+
+    def get_stencil(self, stencil, layout_scale=1):
+        """Get a stencil, resized to the layout resolution."""
+        if layout_scale == 1:
+            return self.stencils[stencil]
+        key = (stencil, layout_scale)
+        if key not in self.scaled_stencils:
+            mask = self.stencils[stencil]
+            size = (int(mask.shape[1] * layout_scale), int(mask.shape[0] * layout_scale))
+            img = Image.fromarray(mask).resize(size, Image.NEAREST)
+            scaled = np.array(img)
+            scaled.flags.writeable = False
+            self.scaled_stencils[key] = scaled
+        return self.scaled_stencils[key]
+
+    def get_font(self, font_path):
+        """Get a preloaded font."""
+        with self.lock:
+            if font_path not in self.fonts:
+                self.fonts[font_path] = PreloadedFont(font_path)
+            return self.fonts[font_path]
+
+    def get_renderer(
+        self, cmap, stencil, font_path, background_color="#ffffff", profile="standard"
+    ):
+        """
+        Get a `WordCloud` instance, reused for all articles with the same settings.
+
+        Arguments
+        ---------
+        cmap: str
+            Name of a matplotlib colormap
+        stencil: str
+            Name of the stencil (see `random_stencil`)
+        font_path: str
+            Path to the font file
+        background_color: str, optional
+            Background color
+        profile: str, optional
+            Name of the render profile (see `RENDER_PROFILES`)
+
+        Returns
+        -------
+        wordcloud.WordCloud
+        """
+        if profile not in RENDER_PROFILES:
+            raise ValueError(f"Unknown render profile {profile}")
+        params = dict(RENDER_PROFILES[profile])
+        layout_scale = params.pop("layout_scale")
+        font = self.get_font(font_path)
+        key = (cmap, stencil, font_path, background_color, profile)
+        with self.lock:
+            if key not in self.renderers:
+                self.renderers[key] = WordCloud(
+                    width=int(self.width * layout_scale),
+                    height=int(self.height * layout_scale),
+                    scale=1 / layout_scale,
+                    font_path=font,
+                    colormap=cmap,
+                    background_color=background_color,
+                    mode="RGBA",
+                    mask=self.get_stencil(stencil, layout_scale),
+                    **params,
+                )
+            return self.renderers[key]
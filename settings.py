@@ -14,6 +14,8 @@ class Settings(object):
         self.TWITTER = "twitter"
         self.URLSHORT = "urlshort"
         self.CONFIGS = "configs"
+        self.RATELIMIT = "ratelimit"
+        self.RETRY = "retry"
 
     def get_twitter_bearer_token(self):
         return self.config[self.TWITTER]["bearer_token"]
@@ -50,6 +52,39 @@ class Settings(object):
     def get_font_switch(self):
         return self.config[self.CONFIGS]["allow_font_change"]
 
+    def get_extract_workers(self):
+        return self.config[self.CONFIGS].getint("extract_workers", fallback=4)
+
+    def get_pipeline_queue_size(self):
+        return self.config[self.CONFIGS].getint("pipeline_queue_size", fallback=4)
+
+    def get_post_queue_file(self):
+        return self.config[self.CONFIGS].get("post_queue_file", fallback="post_queue.json")
+
+    def get_post_max_attempts(self):
+        return self.config[self.CONFIGS].getint("post_max_attempts", fallback=5)
+
+    def get_post_max_wait(self):
+        return self.config[self.CONFIGS].getfloat("post_max_wait", fallback=60)
+
+    def get_render_profile(self):
+        return self.config[self.CONFIGS].get("render_profile", fallback="standard")
+
+    def get_mention_render_profile(self):
+        return self.config[self.CONFIGS].get("mention_render_profile", fallback="fast")
+
+    def get_render_workers(self):
+        return self.config[self.CONFIGS].getint("render_workers", fallback=0)
+
+    def get_font_index_file(self):
+        return self.config[self.CONFIGS].get("font_index_file", fallback="font_index.json")
+
+    def get_font_cache_max_size(self):
+        return self.config[self.CONFIGS].getfloat("font_cache_max_size", fallback=100)
+
+    def get_font_negative_ttl(self):
+        return self.config[self.CONFIGS].getfloat("font_negative_ttl", fallback=24)
+
     def get_width(self):
         return int(self.config[self.CONFIGS]["width"])
 
@@ -74,12 +109,31 @@ class Settings(object):
     def get_journal_list(self):
         return self.config[self.CONFIGS]["journal_list"]
 
+    def get_extraction_rules(self):
+        return self.config[self.CONFIGS].get(
+            "extraction_rules", fallback="extraction_rules.json"
+        )
+
     def get_temp_dir(self):
         return self.config[self.CONFIGS]["temp_dir"]
 
     def get_temp_file(self):
         return self.config[self.CONFIGS]["temp_file"]
 
+    def get_image_encoding(self):
+        """Keyword arguments of `wordcloud_renderer.encode_image`."""
+        section = self.config[self.CONFIGS]
+        compress_level = section.get("png_compress_level", fallback="")
+        return dict(
+            image_format=section.get("image_format", fallback="png"),
+            quality=section.getint("image_quality", fallback=85),
+            compress_level=int(compress_level) if compress_level.strip() else None,
+            colors=section.getint("palette_colors", fallback=256),
+        )
+
+    def get_archive_wordclouds(self):
+        return self.config[self.CONFIGS].getboolean("archive_wordclouds", fallback=False)
+
     def get_mentions_file(self):
         return self.config[self.CONFIGS]["mentions_file"]
 
@@ -91,3 +145,97 @@ class Settings(object):
 
     def get_browser_exec_dir(self):
         return self.config[self.CONFIGS]["browser_exec_dir"]
+
+    def get_browser_pool_size(self):
+        return self.config[self.CONFIGS].getint("browser_pool_size", fallback=1)
+
+    def get_browser_max_pages(self):
+        return self.config[self.CONFIGS].getint("browser_max_pages", fallback=50)
+
+    def get_browser_page_load_timeout(self):
+        return self.config[self.CONFIGS].getfloat("browser_page_load_timeout", fallback=60)
+
+    def get_feed_workers(self):
+        return self.config[self.CONFIGS].getint("feed_workers", fallback=8)
+
+    def get_feed_cache_file(self):
+        return self.config[self.CONFIGS].get("feed_cache_file", fallback="feed_cache.json")
+
+    def get_fetch_stats_file(self):
+        return self.config[self.CONFIGS].get("fetch_stats_file", fallback="fetch_stats.json")
+
+    def get_fetch_min_success_rate(self):
+        return self.config[self.CONFIGS].getfloat("fetch_min_success_rate", fallback=0.5)
+
+    def get_fetch_probe_interval(self):
+        return self.config[self.CONFIGS].getfloat("fetch_probe_interval", fallback=24)
+
+    def get_fetch_min_samples(self):
+        return self.config[self.CONFIGS].getint("fetch_min_samples", fallback=3)
+
+    def get_page_cache_dir(self):
+        return self.config[self.CONFIGS].get("page_cache_dir", fallback="page_cache")
+
+    def get_page_cache_max_size(self):
+        return self.config[self.CONFIGS].getfloat("page_cache_max_size", fallback=500)
+
+    def get_page_cache_max_age(self):
+        return self.config[self.CONFIGS].getfloat("page_cache_max_age", fallback=24)
+
+    def get_page_cache_offline(self):
+        return self.config[self.CONFIGS].getboolean("page_cache_offline", fallback=False)
+
+    def get_max_page_size(self):
+        return self.config[self.CONFIGS].getfloat("max_page_size", fallback=10)
+
+    def get_feed_timeout(self):
+        return self.config[self.CONFIGS].getfloat("feed_timeout", fallback=30)
+
+    def get_http_connect_timeout(self):
+        return self.config[self.CONFIGS].getfloat("http_connect_timeout", fallback=10)
+
+    def get_http_read_timeout(self):
+        return self.config[self.CONFIGS].getfloat("http_read_timeout", fallback=30)
+
+    def get_http_retries(self):
+        return self.config[self.CONFIGS].getint("http_retries", fallback=3)
+
+    def get_http_pool_size(self):
+        return self.config[self.CONFIGS].getint("http_pool_size", fallback=10)
+
+    def get_rate_limits(self):
+        """Default (rate, burst) and a dictionary of per-host (rate, burst)."""
+        if not self.config.has_section(self.RATELIMIT):
+            return (0.2, 1), {}
+        section = self.config[self.RATELIMIT]
+        default = (section.getfloat("rate", fallback=0.2), section.getint("burst", fallback=1))
+        host_limits = {}
+        for host, value in section.items():
+            if host in ["rate", "burst"]:
+                continue
+            rate, burst = value.split(",")
+            host_limits[host] = (float(rate), int(burst))
+        return default, host_limits
+
+    def get_retry_ttls(self):
+        """Hours before failed entries are retried, by failure class (0 = never)."""
+        defaults = dict(
+            no_text=0,
+            short_text=24,
+            render_error=1,
+            http_4xx=72,
+            http_5xx=6,
+            fetch_error=6,
+            paywalled=0,
+            unsupported_content=0,
+            post_error=6,
+        )
+        return {
+            k: self.config.getfloat(self.RETRY, k, fallback=v) for k, v in defaults.items()
+        }
+
+    def get_retry_backoff(self):
+        return self.config.getfloat(self.RETRY, "backoff", fallback=2)
+
+    def get_retry_max_attempts(self):
+        return self.config.getint(self.RETRY, "max_attempts", fallback=5)
@@ -3,15 +3,37 @@
 # Local modules
 from logger import logger
 
-IMPLEMENTED = ["bitly"]
+IMPLEMENTED = ["bitly", "bitly_v4"]
+BITLY_V4_URL = "https://api-ssl.bitly.com/v4/shorten"
+
+
+class BitlyV4(object):
+    """Minimal bitly API v4 client sending requests through the shared HTTP client."""
+
+    def __init__(self, client, api_key, **kwargs):
+        self.client = client
+        self.headers = {"Authorization": f"Bearer {api_key}"}
+
+    def shorten(self, url):
+        req = self.client.post(
+            BITLY_V4_URL, json={"long_url": url}, headers=self.headers, rate_limited=False
+        )
+        req.raise_for_status()
+        return {"url": req.json()["link"]}
 
 
 class UrlShortener(object):
-    def __init__(self, api_name="bitly", **keys):
+    def __init__(self, api_name="bitly", client=None, **keys):
         if api_name == "bitly":
             import bitly_api
 
             self.api = bitly_api.Connection(**keys)
+        elif api_name == "bitly_v4":
+            if client is None:
+                from http_client import HttpClient
+
+                client = HttpClient()
+            self.api = BitlyV4(client, **keys)
         else:
             raise NotImplementedError(f"Only one of {IMPLEMENTED} are allowed")
 
@@ -1,6 +1,9 @@
 # -*- coding: utf-8 -*-
 """Twitter API class for atmosscibot."""
+import io
 import time
+
+import requests
 import tweepy
 
 # Local modules
@@ -15,7 +18,6 @@ class TwitterApi(object):
         api_secret,
         access_token,
         access_token_secret,
-        retry_seconds=5,
     ):
         self.bearer_token = (
             bearer_token  # not used; possibly needed for higher access??
@@ -30,8 +32,8 @@ class TwitterApi(object):
         self.client_v1 = self.get_twitter_api_v1()
         self.client_v2 = self.get_twitter_api_v2()
 
-        # In case of error, try again one more time after n seconds
-        self.retry_seconds = retry_seconds
+        # UNIX time until which the rate limit is exhausted, by endpoint
+        self.rate_limit_reset = {}
 
     def get_twitter_api_v1(self) -> tweepy.API:
         """Get twitter API 1.1"""
@@ -49,6 +51,8 @@ class TwitterApi(object):
             consumer_secret=self.api_secret,
             access_token=self.access_token,
             access_token_secret=self.access_token_secret,
+            # Keep the headers, which contain the rate limits
+            return_type=requests.Response,
         )
         return client
 
@@ -66,31 +70,67 @@ class TwitterApi(object):
         tweet_text = tweet_text[:text_len] + ellipsis + short_url
         return tweet_text
 
+    def update_rate_limit(self, endpoint, response):
+        """Remember when the rate limit resets if there are no requests left."""
+        if response is None:
+            return
+        remaining = response.headers.get("x-rate-limit-remaining")
+        reset = response.headers.get("x-rate-limit-reset")
+        if reset is not None and (remaining == "0" or response.status_code == 429):
+            self.rate_limit_reset[endpoint] = int(reset)
+            logger.info(f"Rate limit of {endpoint} exhausted until {time.ctime(int(reset))}")
+
+    def blocked_until(self):
+        """UNIX time until which posting is rate limited (0 if it is not)."""
+        reset = max(self.rate_limit_reset.values(), default=0)
+        return reset if reset > time.time() else 0
+
+    def upload_media(self, imgname, image=None):
+        """
+        Upload an image; return the media ID.
+
+        If `image` (bytes) is given, it is uploaded from memory and `imgname`
+        is only used to guess the image type.
+        """
+        try:
+            if image is not None:
+                media = self.client_v1.media_upload(filename=imgname, file=io.BytesIO(image))
+            else:
+                media = self.client_v1.media_upload(filename=imgname)
+        except tweepy.errors.HTTPException as e:
+            self.update_rate_limit("media", e.response)
+            raise
+        self.update_rate_limit("media", self.client_v1.last_response)
+        return media.media_id
+
+    def create_tweet(self, **kwargs):
+        """Create a tweet; return its ID."""
+        try:
+            response = self.client_v2.create_tweet(**kwargs)
+        except tweepy.errors.HTTPException as e:
+            self.update_rate_limit("tweets", e.response)
+            raise
+        self.update_rate_limit("tweets", response)
+        return response.json()["data"]["id"]
+
     def post_tweet(
-        self, tweet_text, short_url, imgname=None, in_reply_to_tweet_id=None
+        self, tweet_text, short_url, imgname=None, in_reply_to_tweet_id=None, image=None
     ):
-        """Update status with a wordcloud image"""
+        """
+        Update status with a wordcloud image.
+
+        The image is read from `imgname` or, if given, from `image` (bytes).
+
+        Returns the ID of the tweet. Errors (tweepy.errors.TweepyException)
+        are raised, so that the caller can retry the post later.
+        """
         if in_reply_to_tweet_id is None:
             tweet_text = self.assemble_tweet_text(tweet_text, short_url)
             kwargs = dict(text=tweet_text)
         else:
             kwargs = dict(text=tweet_text, in_reply_to_tweet_id=in_reply_to_tweet_id)
 
-        try:
-            if imgname is not None:
-                # Tweet text and image
-                try:
-                    media = self.client_v1.media_upload(filename=imgname)
-                    self.client_v2.create_tweet(media_ids=[media.media_id], **kwargs)
-                except tweepy.errors.TweepyException as e:
-                    logger.info(
-                        f"Encountered {e}, retrying after {self.retry_seconds} s"
-                    )
-                    time.sleep(self.retry_seconds)
-                    media = self.client_v1.media_upload(filename=imgname)
-                    self.client_v2.create_tweet(media_ids=[media.media_id], **kwargs)
-            else:
-                # post tweet without a wordcloud
-                self.client_v2.create_tweet(**kwargs)
-        except Exception as e:
-            logger.info(f"Encountered {e}. kwargs={kwargs}; image={imgname}")
+        if imgname is not None:
+            # Tweet text and image
+            kwargs["media_ids"] = [self.upload_media(imgname, image=image)]
+        return self.create_tweet(**kwargs)
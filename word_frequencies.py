@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""Word frequencies of article texts for word clouds."""
+# Standard library
+from collections import OrderedDict
+import hashlib
+import os
+import re
+import threading
+
+# External packages
+from wordcloud import STOPWORDS
+from wordcloud.tokenization import process_tokens, unigrams_and_bigrams
+
+
+# Same tokens as `WordCloud.process_text`
+TOKEN_RE = re.compile(r"\w[\w']*")
+
+
+class StopwordSet(object):
+    """
+    Words excluded from word clouds: wordcloud's STOPWORDS and `*.txt` files in a directory.
+
+    The files are read once and read again only if the directory or any of
+    the files is modified.
+
+    Arguments
+    ---------
+    stopwords_dir: str
+        Directory with text files (one word per line)
+    """
+
+    def __init__(self, stopwords_dir):
+        self.stopwords_dir = stopwords_dir
+        self.lock = threading.Lock()
+        self.mtimes = None
+        self.words = frozenset()
+
+    def get_mtimes(self):
+        mtimes = [("", os.path.getmtime(self.stopwords_dir))]
+        for i in os.scandir(self.stopwords_dir):
+            if i.name.endswith(".txt"):
+                mtimes.append((i.name, i.stat().st_mtime))
+        return tuple(sorted(mtimes))
+
+    def reload_if_changed(self):
+        """
+        Read the files again if any of them has changed.
+
+        Returns
+        -------
+        bool
+            True if the stopwords were reloaded
+        """
+        mtimes = self.get_mtimes()
+        with self.lock:
+            if mtimes == self.mtimes:
+                return False
+            words = set(STOPWORDS)
+            for fname, _ in mtimes[1:]:
+                with open(os.path.join(self.stopwords_dir, fname), "r") as f:
+                    words.update(f.read().split("\n"))
+            # Stopwords are compared in lower case
+            self.words = frozenset(i.lower() for i in words)
+            self.mtimes = mtimes
+            return True
+
+
+class WordFrequencies(object):
+    """
+    Count words in article texts, as `WordCloud.process_text` does.
+
+    The counts are cached by the hash of the text, so that rendering a word cloud
+    of the same article again does not tokenize it again.
+
+    Arguments
+    ---------
+    stopwords_dir: str
+        Directory with text files of words to exclude
+    cache_size: int, optional
+        Number of texts whose frequencies are cached
+    collocations: bool, optional
+        Whether to include collocations (bigrams) of two words
+    """
+
+    def __init__(self, stopwords_dir, cache_size=64, collocations=True):
+        self.stopwords = StopwordSet(stopwords_dir)
+        self.cache_size = cache_size
+        self.collocations = collocations
+        self.lock = threading.Lock()
+        self.cache = OrderedDict()
+
+    def tokenize(self, text):
+        """Split the text into words, dropping "'s" and numbers."""
+        words = []
+        for word in TOKEN_RE.findall(text):
+            if word.lower().endswith("'s"):
+                word = word[:-2]
+            if not word.isdigit():
+                words.append(word)
+        return words
+
+    def count(self, text):
+        """Count words of the text, excluding stopwords (not cached)."""
+        stopwords = self.stopwords.words
+        words = self.tokenize(text)
+        if self.collocations:
+            return unigrams_and_bigrams(words, stopwords)
+        counts, _ = process_tokens([w for w in words if w.lower() not in stopwords])
+        return counts
+
+    def get(self, text):
+        """
+        Get word frequencies of the text.
+
+        Arguments
+        ---------
+        text: str
+            Article text
+
+        Returns
+        -------
+        dict
+            Word counts, to be passed to `WordCloud.generate_from_frequencies`
+        """
+        if self.stopwords.reload_if_changed():
+            with self.lock:
+                self.cache.clear()
+        key = hashlib.sha1(text.encode("utf-8")).hexdigest()
+        with self.lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                return self.cache[key]
+        counts = self.count(text)
+        with self.lock:
+            self.cache[key] = counts
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return counts
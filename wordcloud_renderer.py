@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+"""Render word clouds in the main process or in a pool of worker processes."""
+# Standard library
+from concurrent.futures import Future, ProcessPoolExecutor
+import io
+import multiprocessing as mp
+import threading
+
+# External packages
+from PIL import Image
+
+# Local modules
+from render_assets import RenderAssets
+
+
+# Output formats and their file extensions
+IMAGE_FORMATS = {"png": "png", "palette": "png", "webp": "webp", "jpeg": "jpg"}
+
+
+class RenderResult(object):
+    """
+    Result of rendering a word cloud.
+
+    Attributes
+    ----------
+    data: bytes or None
+        Encoded word cloud image; None if rendering failed
+    extension: str or None
+        File extension of the image format
+    error: Exception or None
+        Exception raised while rendering
+    """
+
+    def __init__(self, data=None, extension=None, error=None):
+        self.data = data
+        self.extension = extension
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    @property
+    def filename(self):
+        """File name used for uploading the image."""
+        return f"wordcloud.{self.extension}"
+
+
+def encode_image(image, image_format="png", quality=85, compress_level=None, colors=256):
+    """
+    Encode an image.
+
+    Arguments
+    ---------
+    image: PIL.Image.Image
+        Image
+    image_format: str, optional
+        One of `IMAGE_FORMATS`:
+
+        * "png": full-colour PNG
+        * "palette": PNG quantized to `colors` colours (word clouds use few colours)
+        * "webp", "jpeg": lossy formats with the given `quality`
+    quality: int, optional
+        Quality (1-100) of WebP and JPEG images
+    compress_level: int, optional
+        zlib compression level (0-9) of PNG images; by default, PNG images are
+        optimized (the slowest level)
+    colors: int, optional
+        Number of colours of palette images
+
+    Returns
+    -------
+    data: bytes
+        Encoded image
+    extension: str
+        File extension
+    """
+    if image_format not in IMAGE_FORMATS:
+        raise ValueError(f"Unknown image format {image_format}")
+    if image.mode == "RGBA" and image.getextrema()[3][0] == 255:
+        # Fully opaque, so the alpha channel is not needed
+        image = image.convert("RGB")
+    buf = io.BytesIO()
+    if image_format in ["png", "palette"]:
+        if image_format == "palette":
+            image = image.quantize(colors=colors, method=Image.Quantize.FASTOCTREE)
+        if compress_level is None:
+            image.save(buf, format="PNG", optimize=True)
+        else:
+            image.save(buf, format="PNG", compress_level=compress_level)
+    elif image_format == "webp":
+        image.save(buf, format="WEBP", quality=quality)
+    else:
+        image.convert("RGB").save(buf, format="JPEG", quality=quality, optimize=True)
+    return buf.getvalue(), IMAGE_FORMATS[image_format]
+
+
+def render_wordcloud(
+    assets,
+    frequencies,
+    cmap,
+    stencil,
+    font_path,
+    background_color="#ffffff",
+    encoding=None,
+    profile="standard",
+):
+    """
+    Render a word cloud and encode it; the result depends only on the arguments.
+
+    Arguments
+    ---------
+    assets: render_assets.RenderAssets
+        Stencils, fonts and renderers
+    frequencies: dict
+        Word counts
+    cmap: str
+        Name of a matplotlib colormap
+    stencil: str
+        Name of the stencil
+    font_path: str
+        Path to the font file
+    background_color: str, optional
+        Background color
+    encoding: dict, optional
+        Keyword arguments of `encode_image`
+    profile: str, optional
+        Name of the render profile (see `render_assets.RENDER_PROFILES`)
+
+    Returns
+    -------
+    RenderResult
+    """
+    try:
+        wc = assets.get_renderer(
+            cmap, stencil, font_path, background_color=background_color, profile=profile
+        )
+        wc.generate_from_frequencies(frequencies)
+        data, extension = encode_image(wc.to_image(), **(encoding or {}))
+        return RenderResult(data=data, extension=extension)
+    except Exception as e:
+        return RenderResult(error=e)
+
+
+# Assets of a worker process
+_worker_assets = None
+
+
+def _init_worker(stencil_dir, width, height, default_font):
+    global _worker_assets
+    _worker_assets = RenderAssets(stencil_dir, width, height, default_font=default_font)
+
+
+def _render_in_worker(*args):
+    return render_wordcloud(_worker_assets, *args)
+
+
+class WordCloudRenderer(object):
+    """
+    Render word clouds, optionally in parallel in worker processes.
+
+    Each worker process loads its own stencils and fonts once.
+
+    Arguments
+    ---------
+    stencil_dir: str
+        Directory with stencil images
+    width: int
+        Width of word clouds
+    height: int
+        Height of word clouds
+    default_font: str, optional
+        Path to a font that is loaded immediately
+    workers: int, optional
+        Number of worker processes; 0 to render in the calling process
+    encoding: dict, optional
+        Keyword arguments of `encode_image`
+    """
+
+    def __init__(
+        self, stencil_dir, width, height, default_font=None, workers=0, encoding=None
+    ):
+        self.assets = RenderAssets(stencil_dir, width, height, default_font=default_font)
+        self.workers = workers
+        self.encoding = encoding
+        # Renderers keep the layout of the last word cloud, so they are not shared
+        # between threads
+        self.lock = threading.Lock()
+        self.pool = None
+        if workers > 0:
+            self.pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=mp.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(stencil_dir, width, height, default_font),
+            )
+
+    def random_stencil(self):
+        """Name of a randomly chosen stencil."""
+        return self.assets.random_stencil()
+
+    def submit(
+        self, frequencies, cmap, stencil, font_path, background_color="#ffffff", profile="standard"
+    ):
+        """
+        Start rendering a word cloud.
+
+        Arguments are the same as in `render_wordcloud` (without `assets`).
+
+        Returns
+        -------
+        concurrent.futures.Future
+            Future whose result is a RenderResult
+        """
+        args = (frequencies, cmap, stencil, font_path, background_color, self.encoding, profile)
+        if self.pool is not None:
+            return self.pool.submit(_render_in_worker, *args)
+        future = Future()
+        with self.lock:
+            future.set_result(render_wordcloud(self.assets, *args))
+        return future
+
+    def render(
+        self, frequencies, cmap, stencil, font_path, background_color="#ffffff", profile="standard"
+    ):
+        """Render a word cloud and wait for the RenderResult."""
+        future = self.submit(frequencies, cmap, stencil, font_path, background_color, profile)
+        try:
+            return future.result()
+        except Exception as e:
+            # e.g. a worker process died
+            return RenderResult(error=e)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()